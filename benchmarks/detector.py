@@ -0,0 +1,238 @@
+"""
+Benchmark Person Detector - Đo chi phí detection theo backend, imgsz, ROI và số thread
+
+Chạy:
+    python -m benchmarks.detector                       # frame tổng hợp
+    python -m benchmarks.detector --video kiosk.mp4     # clip ghi từ kiosk
+    python -m benchmarks.detector --backends torch onnx --imgsz 320 640 \\
+        --threads 1 2 4 --roi on off --output results.json
+
+Mỗi cấu hình báo p50/p95/p99 latency, throughput, peak RSS và CPU%.
+Inference đi đúng đường PersonDetector dùng (ROI theo CameraStream,
+LetterboxPreprocessor + predict_preprocessed khi backend hỗ trợ).
+Kết quả ghi ra JSON để so sánh giữa các phiên bản.
+"""
+import argparse
+import itertools
+import json
+import platform
+import resource
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+from utils.config_loader import get_config
+from utils.video_utils import FrameSource
+from modules.camera_stream import CameraStream, load_zones
+from modules.detector_backends import LetterboxPreprocessor, create_backend
+
+def load_video_frames(path: str, count: int, resolution: Tuple[int, int]) -> List[np.ndarray]:
+    """Đọc tối đa count frame từ clip, resize về resolution"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Không thể mở video {path}")
+    
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if (frame.shape[1], frame.shape[0]) != resolution:
+            frame = cv2.resize(frame, resolution, interpolation=cv2.INTER_AREA)
+        frames.append(frame)
+    cap.release()
+    
+    if not frames:
+        raise RuntimeError(f"Video {path} không có frame nào")
+    return frames
+
+def synthetic_frames(count: int, resolution: Tuple[int, int], seed: int = 0) -> List[np.ndarray]:
+    """
+    Frame tổng hợp: nền nhiễu cố định + một khối di chuyển qua vùng giữa
+    
+    Đủ để đo latency (chi phí YOLO gần như không phụ thuộc nội dung), không
+    dùng để đánh giá độ chính xác.
+    """
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (0, 0), 3)
+    
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        x = int((i / max(1, count - 1)) * (width - width // 6))
+        cv2.rectangle(frame, (x, height // 4), (x + width // 6, height - height // 8),
+                      (40, 60, 200), -1)
+        frames.append(frame)
+    return frames
+
+def roi_bounds(config, resolution: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """Vùng crop ROI do CameraStream tính (giống hệt PersonDetector)"""
+    stream = CameraStream(
+        name="benchmark",
+        source=FrameSource("benchmark"),  # Không mở, chỉ cần zone
+        zones=load_zones(config.get('camera.zones'), config.get('camera.detection_zone')),
+        resolution=resolution
+    )
+    width, height = resolution
+    return stream.roi_bounds((height, width), config.get('person_detection.roi.margin', 32))
+
+def default_torch_threads() -> Optional[int]:
+    """Số thread mặc định của PyTorch, đọc trước khi backend nào đổi nó"""
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch.get_num_threads()
+
+def peak_rss_mb() -> float:
+    """Peak RSS của process (MB) - chỉ tăng, không giảm giữa các cấu hình"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+def run_config(backend_name: str, model_path: str, imgsz: int, roi: bool,
+               threads: Optional[int], frames: List[np.ndarray], warmup: int,
+               bounds: Tuple[int, int, int, int], conf_threshold: float,
+               preprocess: bool = True, torch_threads: Optional[int] = None) -> dict:
+    """
+    Benchmark một cấu hình, trả về dict kết quả
+    
+    torch.set_num_threads có tác dụng cho cả process: cấu hình threads=None
+    đặt lại torch_threads (mặc định đọc lúc đầu) thay vì kế thừa hàng trước.
+    """
+    if threads is None and backend_name == 'torch':
+        threads = torch_threads
+    options = {'imgsz': imgsz, 'conf_threshold': conf_threshold, 'num_threads': threads}
+    
+    load_start = time.time()
+    backend = create_backend(backend_name, model_path, **options)
+    load_time = time.time() - load_start
+    
+    x1, y1, x2, y2 = bounds
+    inputs = [frame[y1:y2, x1:x2] if roi else frame for frame in frames]
+    
+    # Cùng đường inference với PersonDetector._infer
+    preprocess = preprocess and backend.supports_preprocessed
+    if preprocess:
+        preprocessor = LetterboxPreprocessor()
+        size = backend.resolve_imgsz(imgsz)
+        
+        def infer(image):
+            blob, metas = preprocessor([image], size, backend.input_stride)
+            return backend.predict_preprocessed(blob, metas)[0]
+    else:
+        def infer(image):
+            return backend.predict(image, imgsz)
+    
+    for i in range(warmup):
+        infer(inputs[i % len(inputs)])
+    
+    latencies = np.empty(len(inputs), dtype=np.float64)
+    detections = 0
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for i, image in enumerate(inputs):
+        start = time.perf_counter()
+        output = infer(image)
+        latencies[i] = time.perf_counter() - start
+        detections += int(np.count_nonzero(output[:, 5] == 0))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+    return {
+        'backend': backend_name,
+        'imgsz': imgsz,
+        'roi': roi,
+        'threads': threads,
+        'preprocess': preprocess,
+        'frames': len(inputs),
+        'load_time_s': round(load_time, 3),
+        'latency_ms': {
+            'mean': round(float(latencies.mean() * 1000), 2),
+            'p50': round(float(p50), 2),
+            'p95': round(float(p95), 2),
+            'p99': round(float(p99), 2),
+        },
+        'throughput_fps': round(len(inputs) / wall, 2),
+        'cpu_percent': round(100.0 * cpu / wall, 1),  # > 100% khi dùng nhiều core
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'person_detections': detections,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark person detection")
+    parser.add_argument('--config', type=str, default='config.yaml', help='File cấu hình (zone, model)')
+    parser.add_argument('--model', type=str, help='Model (mặc định: person_detection.model)')
+    parser.add_argument('--video', type=str, help='Clip dùng để benchmark (mặc định: frame tổng hợp)')
+    parser.add_argument('--frames', type=int, default=100, help='Số frame đo cho mỗi cấu hình')
+    parser.add_argument('--warmup', type=int, default=5, help='Số lần chạy bỏ qua trước khi đo')
+    parser.add_argument('--backends', nargs='+', default=['torch'], help='torch, onnx')
+    parser.add_argument('--imgsz', nargs='+', type=int, default=[320, 640])
+    parser.add_argument('--roi', nargs='+', choices=['on', 'off'], default=['off', 'on'])
+    parser.add_argument('--threads', nargs='+', type=int, default=[0],
+                        help='Số thread torch/ORT (0 = mặc định của runtime)')
+    parser.add_argument('--output', type=str, help='File JSON kết quả '
+                        '(mặc định: benchmarks/results/detector-<thời gian>.json)')
+    args = parser.parse_args()
+    
+    config = get_config(args.config)
+    model_path = args.model or config.get('person_detection.model', 'yolov8n.pt')
+    resolution = (
+        config.get('camera.resolution.width', 640),
+        config.get('camera.resolution.height', 480)
+    )
+    
+    if args.video:
+        frames = load_video_frames(args.video, args.frames, resolution)
+    else:
+        frames = synthetic_frames(args.frames, resolution)
+    bounds = roi_bounds(config, resolution)
+    torch_threads = default_torch_threads()
+    preprocess = config.get('person_detection.preallocated_preprocess', True)
+    
+    print(f"Benchmark {model_path}: {len(frames)} frame {resolution[0]}x{resolution[1]} "
+          f"({'video ' + args.video if args.video else 'tổng hợp'}), ROI {bounds}")
+    
+    results = []
+    for backend_name, imgsz, roi, threads in itertools.product(
+            args.backends, args.imgsz, args.roi, args.threads):
+        label = f"{backend_name:<6} imgsz={imgsz:<4} roi={roi:<3} threads={threads or 'auto'}"
+        try:
+            result = run_config(backend_name, model_path, imgsz, roi == 'on', threads or None,
+                                frames, args.warmup, bounds,
+                                config.get('person_detection.confidence_threshold', 0.5),
+                                preprocess, torch_threads)
+        except Exception as e:
+            print(f"❌ {label}: {e}")
+            results.append({'backend': backend_name, 'imgsz': imgsz, 'roi': roi == 'on',
+                            'threads': threads or None, 'error': str(e)})
+            continue
+        
+        latency = result['latency_ms']
+        print(f"✅ {label}: p50 {latency['p50']:.1f}ms  p95 {latency['p95']:.1f}ms  "
+              f"p99 {latency['p99']:.1f}ms  {result['throughput_fps']:.1f} FPS  "
+              f"CPU {result['cpu_percent']:.0f}%  RSS {result['peak_rss_mb']:.0f}MB")
+        results.append(result)
+    
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'model': model_path,
+        'source': args.video or 'synthetic',
+        'resolution': list(resolution),
+        'roi_bounds': list(bounds),
+        'results': results,
+    }
+    
+    output = Path(args.output or f"benchmarks/results/detector-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"Đã ghi kết quả: {output}")
+
+if __name__ == "__main__":
+    main()
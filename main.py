@@ -10,7 +10,7 @@ from enum import Enum
 
 from utils.logger import setup_logger
 from utils.config_loader import get_config
-from modules.person_detector import PersonDetector
+from modules.person_detector import PersonDetector, PersonEntered
 from modules.wake_word import WakeWordDetector
 from modules.stt_engine import STTEngine
 from modules.llm_client import LLMClient
@@ -50,6 +50,11 @@ class UETBot:
         self.enable_person_detection = self.config.get('person_detection.enable', True)
         self.enable_wake_word = self.config.get('wake_word.enable', True)
         self.conversation_timeout = self.config.get('general.conversation_timeout', 30)
+        self.pause_detection_in_conversation = self.config.get(
+            'person_detection.scheduler.pause_in_conversation', True
+        )
+        self.skip_greeting = self.config.get('wake_word.skip_greeting', False)
+        self.activation_source = None  # "person" hoặc "wake_word"
         
         # Initialize modules
         self.logger.info("Đang khởi tạo các module...")
@@ -63,6 +68,10 @@ class UETBot:
             if self.enable_person_detection:
                 self.person_detector = PersonDetector(self.config)
                 self.person_detector.start_camera()
+                
+                # Inference chạy trong worker riêng, không chặn việc đọc audio
+                if self.config.get('person_detection.async_worker', True):
+                    self.person_detector.start_worker()
             else:
                 self.person_detector = None
                 self.logger.info("Person detection đã bị tắt.")
@@ -107,6 +116,13 @@ class UETBot:
             
             if state in emotion_map:
                 self.face.set_emotion(emotion_map[state])
+            
+            # Không cần person detection trong lúc hội thoại
+            if self.person_detector and self.pause_detection_in_conversation:
+                if state in (BotState.LISTENING, BotState.THINKING, BotState.SPEAKING):
+                    self.person_detector.pause()
+                else:
+                    self.person_detector.resume()
     
     def wait_for_activation(self) -> bool:
         """
@@ -125,8 +141,9 @@ class UETBot:
         while self.is_running:
             # Kiểm tra person detection
             if self.enable_person_detection and self.person_detector:
-                if self.person_detector.detect_person_in_zone():
+                if self._person_activated():
                     self.logger.info("✅ Kích hoạt bởi: Person Detection")
+                    self.activation_source = "person"
                     self.face.set_emotion(Emotion.HAPPY)
                     time.sleep(0.5)  # Show happy emotion
                     return True
@@ -135,6 +152,7 @@ class UETBot:
             if self.enable_wake_word and self.wake_word_detector:
                 if self.wake_word_detector.check_for_wake_word():
                     self.logger.info("✅ Kích hoạt bởi: Wake Word")
+                    self.activation_source = "wake_word"
                     self.face.set_emotion(Emotion.HAPPY)
                     time.sleep(0.5)
                     return True
@@ -143,19 +161,55 @@ class UETBot:
         
         return False
     
+    def _person_activated(self) -> bool:
+        """
+        Kiểm tra kích hoạt bởi person detection
+        
+        Nếu detection worker đang chạy thì chỉ tiêu thụ event (không chặn),
+        ngược lại chạy YOLO inline như cũ.
+        """
+        if not self.person_detector.worker_running:
+            return self.person_detector.detect_person_in_zone()
+        
+        activated = False
+        while True:
+            event = self.person_detector.get_event()
+            if event is None:
+                break
+            
+            self.logger.debug(f"Person event: {type(event).__name__} "
+                              f"(latency: {event.latency * 1000:.0f}ms)")
+            if isinstance(event, PersonEntered):
+                activated = True
+        
+        return activated
+    
     def handle_conversation(self):
         """Xử lý một lượt hội thoại"""
         try:
-            # 1. Chào hỏi
-            self.set_state(BotState.SPEAKING)
-            greeting = "Xin chào! Tôi có thể giúp gì cho bạn?"
-            self.tts.speak(greeting)
+            user_text = None
+            if self.skip_greeting and self.activation_source == "wake_word":
+                # "Hi UETBot, phòng 301 ở đâu?" -> trả lời luôn, không chào hỏi
+                user_text = self.wake_word_detector.trailing_text
+                if not user_text:
+                    self.set_state(BotState.LISTENING)
+                    self.logger.info("🎤 Đang lắng nghe (từ lúc gọi wake word)...")
+                    user_text = self.stt.transcribe_from_mic(
+                        start=self.wake_word_detector.detection_position
+                    )
             
-            # 2. Lắng nghe user
-            self.set_state(BotState.LISTENING)
-            self.logger.info("🎤 Đang lắng nghe...")
-            
-            user_text = self.stt.transcribe_from_mic()
+            if not user_text:
+                # Chỉ gọi "Hi UETBot" (không kèm câu hỏi) -> chào và lắng nghe như thường
+                # 1. Chào hỏi
+                self.set_state(BotState.SPEAKING)
+                greeting = "Xin chào! Tôi có thể giúp gì cho bạn?"
+                self.tts.speak(greeting)
+                
+                # 2. Lắng nghe user (kèm pre-roll: câu nói chen vào lúc chào không bị mất)
+                self.set_state(BotState.LISTENING)
+                self.logger.info("🎤 Đang lắng nghe...")
+                
+                user_text = self.stt.transcribe_from_mic()
             
             if not user_text:
                 self.logger.warning("Không nghe rõ, thử lại...")
@@ -238,7 +292,10 @@ class UETBot:
             self.person_detector.stop_camera()
         
         if self.wake_word_detector:
-            self.wake_word_detector.stop_listening()
+            self.wake_word_detector.close()
+        
+        if getattr(self, 'stt', None):
+            self.stt.close()
         
         self.face.stop()
         
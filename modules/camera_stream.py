@@ -0,0 +1,276 @@
+"""
+Camera Stream - Trạng thái của một camera trong PersonDetector
+Gồm capture, các zone, motion gate, tracker và trạng thái presence riêng
+"""
+import cv2
+import numpy as np
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+from utils.video_utils import FrameSource, LatestFrameCapture, MotionGate
+from modules.person_tracker import PersonTracker
+
+def load_zones(zones_config, detection_zone) -> List[Tuple[str, np.ndarray]]:
+    """
+    Đọc danh sách zone
+    
+    Args:
+        zones_config: List {name, polygon: [[x, y], ...]} hoặc None
+        detection_zone: Dict {x, y, width, height}, dùng làm zone "default"
+            khi không có zones_config
+    
+    Returns:
+        List (tên zone, polygon (K, 2) int32)
+    """
+    zones = []
+    
+    if zones_config:
+        for i, zone in enumerate(zones_config):
+            name = zone.get('name', f"zone{i}")
+            polygon = np.array(zone['polygon'], dtype=np.int32).reshape(-1, 2)
+            zones.append((name, polygon))
+    else:
+        detection_zone = detection_zone or {}
+        x1, y1 = detection_zone.get('x', 160), detection_zone.get('y', 120)
+        x2 = x1 + detection_zone.get('width', 320)
+        y2 = y1 + detection_zone.get('height', 240)
+        polygon = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.int32)
+        zones.append(("default", polygon))
+    
+    return zones
+
+class CameraStream:
+    """Một nguồn frame cùng zone, motion gate, tracker và presence của nó"""
+    
+    def __init__(self,
+                 name: str,
+                 source: FrameSource,
+                 zones: List[Tuple[str, np.ndarray]],
+                 resolution: Tuple[int, int] = (640, 480),
+                 use_capture_thread: bool = True,
+                 motion_gate_options: Optional[dict] = None,
+                 tracker_options: Optional[dict] = None):
+        """
+        Args:
+            name: Tên camera (dùng trong log/event)
+            source: Camera, file video hoặc thư mục ảnh
+            zones: List (tên zone, polygon)
+            resolution: (width, height) dùng để rasterize zone
+            use_capture_thread: Bật LatestFrameCapture (chỉ với camera thật,
+                nguồn replay luôn đọc tuần tự để không bỏ frame)
+            motion_gate_options: Tham số MotionGate (None = tắt)
+            tracker_options: Tham số PersonTracker (None = tắt)
+        """
+        self.name = name
+        self.source = source
+        self.resolution = resolution
+        self.use_capture_thread = use_capture_thread and source.live
+        
+        # Các zone dạng polygon, rasterize một lần thành mask để tra cứu
+        self.zones = zones
+        self.zone_masks = None  # (Z, H, W) bool
+        self._rasterize_zones(*resolution)
+        self.zone_bounds = self._zone_bounds()
+        
+        # Motion gate: bỏ qua YOLO khi vùng zone không có chuyển động
+        self.motion_gate = None
+        if motion_gate_options is not None:
+            self.motion_gate = MotionGate(roi=self.zone_bounds, **motion_gate_options)
+        
+        # Tracker
+        self.tracker = None
+        if tracker_options is not None:
+            self.tracker = PersonTracker(**tracker_options)
+        self.last_detect_time = None
+        self.triggered_tracks = set()
+        
+        # Camera
+        self.opened = False
+        self.capture = None  # LatestFrameCapture (nếu bật capture_thread)
+        self.last_frame_seq = 0
+        self._frames_read = 0  # Đếm frame khi đọc trực tiếp từ source
+        
+        # Presence
+        self.person_present = False
+        self.last_seen = None  # (frame_timestamp, ZoneDetection)
+        
+        # Frame cuối cùng pipeline đã xử lý, dùng cho preview:
+        # (frame, frame_timestamp, FrameDetections hoặc None, [(track_id, box)])
+        self.last_result = None
+        
+        # FPS inference (tính lúc đọc stats, về 0 khi detector ngừng chạy)
+        self.inferences = 0
+        self._inference_times = deque(maxlen=64)
+        self._fps_window = 5.0
+    
+    def open(self, logger):
+        """Mở nguồn frame và (tuỳ chọn) khởi động capture thread"""
+        logger.info(f"Đang khởi động {self.source.label}...")
+        
+        if not self.source.open():
+            logger.error(f"Không thể mở {self.source.label}")
+            if self.source.live:
+                logger.error("Hãy chạy: python test_camera.py để tìm device ID đúng")
+            raise RuntimeError(f"Không thể mở {self.source.label}")
+        
+        self.opened = True
+        logger.info(f"Camera '{self.name}' đã sẵn sàng! {self.source.describe()}")
+        
+        if not self.source.live:
+            return
+        
+        # Test đọc frame đầu tiên
+        ret, _, _ = self.source.read()
+        if not ret:
+            logger.warning("Cảnh báo: Camera mở được nhưng chưa đọc được frame. Đợi vài giây...")
+            time.sleep(2)
+            ret, _, _ = self.source.read()
+            if ret:
+                logger.info("✅ Camera đã sẵn sàng sau khi đợi!")
+            else:
+                logger.error("❌ Vẫn không đọc được frame. Kiểm tra camera!")
+        
+        # Thread rút frame liên tục vào slot "frame mới nhất"
+        if self.use_capture_thread:
+            self.capture = LatestFrameCapture(self.source, name=self.name)
+            self.capture.start()
+            logger.info(f"Đã bật capture thread (latest-frame) cho camera '{self.name}'.")
+    
+    def close(self, logger):
+        """Dừng capture thread và release nguồn frame"""
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+        
+        if self.opened:
+            if self.motion_gate is not None and self.motion_gate.frames_seen:
+                logger.info(f"Motion gate '{self.name}': bỏ qua {self.motion_gate.skip_ratio:.1%} frame "
+                            f"({self.motion_gate.frames_seen} frame)")
+            
+            self.source.release()
+            self.opened = False
+            logger.info(f"Đã dừng camera '{self.name}'.")
+    
+    def read_frame(self, wait: bool = False, timeout: float = 0.5
+                   ) -> Tuple[bool, Optional[np.ndarray], int, float]:
+        """
+        Đọc frame từ camera (từ capture thread nếu có)
+        
+        Args:
+            wait: Đợi frame mới từ capture thread (dùng trong worker)
+            timeout: Thời gian chờ tối đa khi wait=True
+        
+        Returns:
+            (ret, frame, seq, timestamp) - seq là số thứ tự frame, tăng dần
+        """
+        if self.capture is not None:
+            frame, seq, timestamp = self.capture.read(wait=wait, timeout=timeout)
+            return frame is not None, frame, seq, timestamp
+        
+        ret, frame, timestamp = self.source.read()
+        if ret:
+            self._frames_read += 1
+        return ret, frame, self._frames_read, timestamp
+    
+    def _rasterize_zones(self, width: int, height: int):
+        """Vẽ các polygon zone thành mask (Z, H, W) cho kích thước frame"""
+        masks = np.zeros((len(self.zones), height, width), dtype=bool)
+        layer = np.zeros((height, width), dtype=np.uint8)
+        
+        for i, (_, polygon) in enumerate(self.zones):
+            layer.fill(0)
+            cv2.fillPoly(layer, [polygon], 1)
+            masks[i] = layer.astype(bool)
+        
+        self.zone_masks = masks
+    
+    def _zone_bounds(self) -> Tuple[int, int, int, int]:
+        """Hình chữ nhật bao tất cả zone (x1, y1, x2, y2), đã clip theo resolution"""
+        points = np.concatenate([polygon for _, polygon in self.zones])
+        x1, y1 = np.maximum(points.min(axis=0), 0)
+        x2, y2 = np.minimum(points.max(axis=0) + 1, self.resolution)
+        return int(x1), int(y1), int(x2), int(y2)
+    
+    def roi_bounds(self, frame_shape, margin: int) -> Tuple[int, int, int, int]:
+        """
+        Vùng crop cho ROI inference: bao các zone + margin, clip theo frame
+        
+        Margin giúp người đứng ở mép zone không bị cắt box, nên center
+        (và kết quả trong zone) giữ nguyên như khi chạy cả frame.
+        """
+        height, width = frame_shape[:2]
+        x1, y1, x2, y2 = self.zone_bounds
+        return (max(0, x1 - margin), max(0, y1 - margin),
+                min(width, x2 + margin), min(height, y2 + margin))
+    
+    def zone_membership(self, boxes: np.ndarray, frame_shape) -> np.ndarray:
+        """
+        Tra cứu center của các box trong zone mask
+        
+        Returns:
+            (Z, N) bool - zone_hits[z, i] = center box i nằm trong zone z
+        """
+        height, width = frame_shape[:2]
+        if self.zone_masks.shape[1:] != (height, width):
+            # Camera trả về resolution khác config -> rasterize lại
+            self._rasterize_zones(width, height)
+        
+        center_x = ((boxes[:, 0] + boxes[:, 2]) * 0.5).astype(np.int32)
+        center_y = ((boxes[:, 1] + boxes[:, 3]) * 0.5).astype(np.int32)
+        inside = (center_x >= 0) & (center_x < width) & (center_y >= 0) & (center_y < height)
+        
+        hits = self.zone_masks[:, np.clip(center_y, 0, height - 1), np.clip(center_x, 0, width - 1)]
+        return hits & inside
+    
+    def should_run_detector(self, frame: np.ndarray, frame_timestamp: float) -> bool:
+        """
+        Hỏi motion gate có cần chạy YOLO cho frame này không
+        
+        Khi đang có người trong zone (hoặc đang có track) luôn chạy, để theo
+        được người đó và phát hiện lúc họ rời đi.
+        """
+        if self.motion_gate is None:
+            return True
+        force = self.person_present or bool(self.tracker and self.tracker.tracks)
+        return self.motion_gate.update(frame, frame_timestamp, force=force)
+    
+    def is_active(self) -> bool:
+        """Camera có chuyển động trong zone, track hoặc người không"""
+        if self.person_present or (self.tracker is not None and self.tracker.tracks):
+            return True
+        return (self.motion_gate is not None and
+                self.motion_gate.motion_energy >= self.motion_gate.threshold)
+    
+    def record_inference(self):
+        """Đếm một lần chạy detector (để tính FPS inference)"""
+        self.inferences += 1
+        self._inference_times.append(time.time())
+    
+    @property
+    def inference_fps(self) -> float:
+        """FPS inference trong vài giây gần nhất (motion gate/scheduler bỏ qua -> giảm dần về 0)"""
+        now = time.time()
+        times = [t for t in self._inference_times if now - t <= self._fps_window]
+        if len(times) < 2:
+            return 0.0
+        # Tính tới hiện tại (không phải lần chạy cuối): ngừng chạy thì FPS giảm ngay
+        elapsed = now - times[0]
+        if elapsed <= 0:
+            return 0.0
+        return (len(times) - 1) / elapsed
+    
+    def get_stats(self) -> dict:
+        """Thống kê camera: presence, FPS capture/inference, motion gate, track"""
+        stats = {
+            'name': self.name,
+            'person_present': self.person_present,
+            'inference_fps': round(self.inference_fps, 1),
+            'inferences': self.inferences,
+        }
+        if self.capture is not None:
+            stats['capture'] = self.capture.get_stats()
+        if self.motion_gate is not None:
+            stats['motion_gate'] = self.motion_gate.get_stats()
+        if self.tracker is not None:
+            stats['tracks'] = len(self.tracker.tracks)
+        return stats
@@ -0,0 +1,169 @@
+"""
+Detection Scheduler - Điều chỉnh tần suất chạy person detection theo trạng thái
+Chạy chậm khi scene trống, tăng tốc khi có chuyển động/người, dừng khi đang hội thoại
+"""
+import threading
+import time
+from collections import deque
+from typing import Optional
+from utils.logger import setup_logger
+
+class DetectionScheduler:
+    """
+    Duty-cycle cho detection
+    
+    - idle: bot rảnh và scene trống -> idle_hz
+    - active: có chuyển động, track hoặc người trong zone -> active_hz,
+      giữ thêm hold_time giây sau lần hoạt động cuối rồi mới hạ về idle
+    - paused: bot đang LISTENING/THINKING/SPEAKING -> không chạy
+    """
+    
+    IDLE = "idle"
+    ACTIVE = "active"
+    PAUSED = "paused"
+    
+    def __init__(self,
+                 idle_hz: float = 2.0,
+                 active_hz: float = 10.0,
+                 hold_time: float = 3.0,
+                 enable: bool = True):
+        """
+        Args:
+            idle_hz: Tần suất khi scene trống (lần/giây)
+            active_hz: Tần suất khi có hoạt động (0 = không giới hạn)
+            hold_time: Giây giữ active_hz sau hoạt động cuối cùng
+            enable: False = chạy hết tốc độ (pause() khi hội thoại vẫn có tác dụng)
+        """
+        self.logger = setup_logger("DetectionScheduler")
+        self.idle_hz = idle_hz
+        self.active_hz = active_hz
+        self.hold_time = hold_time
+        self.enable = enable
+        
+        self._cond = threading.Condition()
+        self._paused = False
+        self._mode = self.IDLE
+        self._last_activity = None
+        self._next_time = 0.0
+        
+        # Effective Hz tính trên các lần chạy gần đây
+        self._ticks = deque(maxlen=64)
+        self._stats_window = 5.0
+        self.runs = 0
+    
+    @property
+    def mode(self) -> str:
+        """Chế độ hiện tại: idle, active hoặc paused"""
+        return self.PAUSED if self._paused else self._mode
+    
+    @property
+    def target_hz(self) -> float:
+        """Tần suất mục tiêu của chế độ hiện tại (0 = không giới hạn)"""
+        if not self.enable:
+            return 0.0
+        if self._paused:
+            return 0.0
+        return self.active_hz if self._mode == self.ACTIVE else self.idle_hz
+    
+    def pause(self):
+        """Dừng detection (vd: đang hội thoại), kể cả khi không bật điều tiết tần suất"""
+        with self._cond:
+            if not self._paused:
+                self.logger.info(f"Tạm dừng detection (đang chạy {self.effective_hz:.1f} Hz).")
+                self._paused = True
+    
+    def resume(self):
+        """Chạy lại detection ở chế độ idle"""
+        with self._cond:
+            if self._paused:
+                self._paused = False
+                self._mode = self.IDLE
+                self._last_activity = None
+                self._next_time = 0.0
+                self._ticks.clear()
+                rate = f"{self.idle_hz:g} Hz" if self.enable else "không giới hạn"
+                self.logger.info(f"Tiếp tục detection ({rate}).")
+            self._cond.notify_all()
+    
+    def due(self, now: Optional[float] = None) -> bool:
+        """Đã đến lượt chạy detection chưa (không block)"""
+        if self._paused:
+            return False
+        if not self.enable:
+            return True
+        now = time.time() if now is None else now
+        return now >= self._next_time
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block tới lượt chạy tiếp theo
+        
+        Args:
+            timeout: Thời gian chờ tối đa (giây)
+        
+        Returns:
+            True nếu đã tới lượt, False nếu hết timeout (đang pause hoặc chưa tới lượt)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while not self.due():
+                now = time.time()
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    return False
+                
+                # Pause -> chờ resume; ngược lại chờ tới slot tiếp theo
+                delay = remaining if self._paused else self._next_time - now
+                if remaining is not None:
+                    delay = min(delay, remaining)
+                self._cond.wait(delay)
+            return True
+    
+    def tick(self, active: bool, now: Optional[float] = None):
+        """
+        Ghi nhận một lần chạy detection và chọn tần suất cho lần tiếp theo
+        
+        Args:
+            active: Frame vừa xử lý có chuyển động/track/người không
+            now: Thời điểm chạy
+        """
+        now = time.time() if now is None else now
+        with self._cond:
+            self.runs += 1
+            self._ticks.append(now)
+            
+            if active:
+                self._last_activity = now
+                if self._mode != self.ACTIVE:
+                    self._mode = self.ACTIVE
+                    self.logger.debug(f"Có hoạt động -> {self.active_hz:g} Hz")
+            elif (self._mode == self.ACTIVE and
+                  (self._last_activity is None or now - self._last_activity >= self.hold_time)):
+                self._mode = self.IDLE
+                self.logger.debug(f"Scene trống -> {self.idle_hz:g} Hz")
+            
+            hz = self.target_hz
+            self._next_time = now + 1.0 / hz if hz > 0 else now
+    
+    @property
+    def effective_hz(self) -> float:
+        """Tần suất chạy thực tế trong vài giây gần nhất"""
+        if self._paused:
+            return 0.0
+        now = time.time()
+        ticks = [t for t in self._ticks if now - t <= self._stats_window]
+        if len(ticks) < 2:
+            return 0.0
+        elapsed = ticks[-1] - ticks[0]
+        if elapsed <= 0:  # Các tick cùng timestamp (độ phân giải đồng hồ)
+            return 0.0
+        return (len(ticks) - 1) / elapsed
+    
+    def get_stats(self) -> dict:
+        """Thống kê: chế độ, tần suất mục tiêu và thực tế"""
+        return {
+            'mode': self.mode,
+            'target_hz': self.target_hz,
+            'effective_hz': round(self.effective_hz, 2),
+            'runs': self.runs,
+        }
@@ -0,0 +1,477 @@
+"""
+Detector Backends - Các backend inference cho PersonDetector
+Hỗ trợ PyTorch (ultralytics) và ONNX Runtime (CPU)
+"""
+import hashlib
+import shutil
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+from utils.logger import setup_logger
+
+# Mỗi detection là một hàng: x1, y1, x2, y2, confidence, class_id
+EMPTY_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
+
+def letterbox(image: np.ndarray, size: int, color: int = 114
+              ) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Resize giữ tỉ lệ rồi pad thành ảnh vuông size x size (giống YOLOv8)
+    
+    Returns:
+        (ảnh đã letterbox, tỉ lệ scale, (pad_left, pad_top))
+    """
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    
+    pad_w, pad_h = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right,
+                               cv2.BORDER_CONSTANT, value=(color, color, color))
+    return image, ratio, (left, top)
+
+def preprocess(image: np.ndarray, imgsz: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Chuẩn bị input cho model ONNX YOLOv8: letterbox, BGR->RGB, HWC->CHW, chuẩn hoá 0-1
+    
+    Returns:
+        (blob (3, imgsz, imgsz) float32, tỉ lệ scale, (pad_left, pad_top))
+    """
+    padded, ratio, pad = letterbox(image, imgsz)
+    blob = padded[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return blob, ratio, pad
+
+class LetterboxPreprocessor:
+    """
+    Letterbox + chuẩn hoá vào buffer cấp phát sẵn
+    
+    Mỗi kích thước canvas có một ảnh uint8 (H, W, 3) và một blob float32
+    (batch, 3, H, W) dùng lại giữa các frame: resize thẳng vào canvas bằng
+    cv2.resize(dst=...), BGR->RGB/HWC->CHW bằng np.copyto vào blob rồi chuẩn
+    hoá 0-1 tại chỗ. Ở trạng thái ổn định không cấp phát mảng mới nào.
+    """
+    
+    def __init__(self, color: int = 114):
+        self.color = color
+        self._canvases = {}  # (H, W) -> (H, W, 3) uint8
+        self._blobs = {}  # (H, W) -> (batch, 3, H, W) float32
+        self._scale = np.float32(1.0 / 255.0)
+    
+    def _buffers(self, shape: Tuple[int, int], batch: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Lấy (hoặc cấp phát lần đầu) canvas và blob cho kích thước/batch"""
+        canvas = self._canvases.get(shape)
+        if canvas is None:
+            canvas = self._canvases[shape] = np.empty((*shape, 3), dtype=np.uint8)
+        
+        blob = self._blobs.get(shape)
+        if blob is None or len(blob) < batch:
+            blob = self._blobs[shape] = np.empty((batch, 3, *shape), dtype=np.float32)
+        return canvas, blob
+    
+    def __call__(self, images: List[np.ndarray], imgsz: int, stride: Optional[int] = None
+                 ) -> Tuple[np.ndarray, list]:
+        """
+        Args:
+            images: Ảnh BGR (có thể là view crop, không cần contiguous)
+            imgsz: Cạnh dài sau khi resize
+            stride: None = canvas vuông imgsz x imgsz (model input cố định);
+                ngược lại canvas chỉ pad tới bội số của stride (model nhận
+                input động, ít pixel thừa hơn)
+        
+        Returns:
+            (blob (N, 3, H, W) float32 - view vào buffer, chỉ hợp lệ tới lần
+            gọi sau; list (ratio, (pad_left, pad_top), (height, width)) mỗi ảnh)
+        """
+        sizes = []
+        for image in images:
+            height, width = image.shape[:2]
+            ratio = min(imgsz / height, imgsz / width)
+            sizes.append((ratio, int(round(width * ratio)), int(round(height * ratio))))
+        
+        if stride:
+            canvas_h = max(-(-new_h // stride) * stride for _, _, new_h in sizes)
+            canvas_w = max(-(-new_w // stride) * stride for _, new_w, _ in sizes)
+        else:
+            canvas_h = canvas_w = imgsz
+        canvas, blob = self._buffers((canvas_h, canvas_w), len(images))
+        
+        metas = []
+        for i, (image, (ratio, new_w, new_h)) in enumerate(zip(images, sizes)):
+            left = int(round((canvas_w - new_w) / 2 - 0.1))
+            top = int(round((canvas_h - new_h) / 2 - 0.1))
+            
+            canvas.fill(self.color)
+            region = canvas[top:top + new_h, left:left + new_w]
+            if (new_w, new_h) != image.shape[1::-1]:
+                cv2.resize(image, (new_w, new_h), dst=region, interpolation=cv2.INTER_LINEAR)
+            else:
+                np.copyto(region, image)
+            
+            # BGR (HWC) -> RGB (CHW)
+            for c in range(3):
+                np.copyto(blob[i, c], canvas[:, :, 2 - c], casting='unsafe')
+            metas.append((ratio, (left, top), image.shape[:2]))
+        
+        batch = blob[:len(images)]
+        np.multiply(batch, self._scale, out=batch)
+        return batch, metas
+
+def decode_predictions(output: np.ndarray, ratio: float, pad_x: int, pad_y: int,
+                       image_shape, conf_threshold: float, iou_threshold: float) -> np.ndarray:
+    """
+    Decode output YOLOv8 (4 + num_classes, anchors), lọc confidence, NMS
+    và map box về toạ độ ảnh gốc
+    """
+    predictions = output.T  # (anchors, 4 + num_classes)
+    class_scores = predictions[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(classes)), classes]
+    
+    keep = scores >= conf_threshold
+    if not keep.any():
+        return EMPTY_DETECTIONS.copy()
+    
+    predictions, classes, scores = predictions[keep], classes[keep], scores[keep]
+    
+    # cx, cy, w, h -> x1, y1, x2, y2
+    boxes = np.empty((len(predictions), 4), dtype=np.float32)
+    half_w, half_h = predictions[:, 2] / 2, predictions[:, 3] / 2
+    boxes[:, 0] = predictions[:, 0] - half_w
+    boxes[:, 1] = predictions[:, 1] - half_h
+    boxes[:, 2] = predictions[:, 0] + half_w
+    boxes[:, 3] = predictions[:, 1] + half_h
+    
+    # NMS theo từng class: dịch box của mỗi class ra vùng riêng
+    offsets = classes[:, None].astype(np.float32) * 4096
+    keep = non_max_suppression(boxes + offsets, scores, iou_threshold)
+    boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+    
+    # Bỏ padding + scale về ảnh gốc
+    boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+    boxes /= ratio
+    height, width = image_shape[:2]
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+    
+    return np.concatenate([
+        boxes, scores[:, None], classes[:, None]
+    ], axis=1).astype(np.float32)
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray,
+                        iou_threshold: float, max_det: int = 300) -> np.ndarray:
+    """
+    NMS bằng NumPy
+    
+    Args:
+        boxes: (N, 4) x1, y1, x2, y2
+        scores: (N,)
+        iou_threshold: Ngưỡng IoU để loại box trùng
+        max_det: Số box tối đa giữ lại
+    
+    Returns:
+        Index các box được giữ lại, sắp theo score giảm dần
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    
+    while order.size > 0 and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        
+        order = rest[iou <= iou_threshold]
+    
+    return np.array(keep, dtype=np.int64)
+
+def file_hash(path: str, length: int = 12) -> str:
+    """SHA1 (rút gọn) của nội dung file, dùng làm key cache"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()[:length]
+
+class DetectorBackend:
+    """
+    Interface chung cho các backend detection
+    
+    predict() nhận ảnh BGR và trả về mảng (N, 6): x1, y1, x2, y2, conf, cls
+    theo toạ độ của ảnh đầu vào.
+    
+    Backend có supports_preprocessed = True nhận thêm blob đã letterbox sẵn
+    (LetterboxPreprocessor) qua predict_preprocessed().
+    """
+    
+    name = "base"
+    supports_preprocessed = False
+    input_stride = None  # Model nhận input động (pad tới bội số stride) hay cố định
+    
+    def start(self):
+        """Chuẩn bị tài nguyên trước lần predict đầu tiên (mặc định: không làm gì)"""
+    
+    def stop(self):
+        """Giải phóng tài nguyên khi camera dừng (mặc định: không làm gì)"""
+    
+    def predict(self, image: np.ndarray, imgsz: Optional[int] = None) -> np.ndarray:
+        raise NotImplementedError
+    
+    def predict_batch(self, images: List[np.ndarray], imgsz: Optional[int] = None
+                      ) -> List[np.ndarray]:
+        """Chạy nhiều ảnh (mặc định: lần lượt từng ảnh)"""
+        return [self.predict(image, imgsz) for image in images]
+    
+    def resolve_imgsz(self, imgsz: Optional[int] = None) -> int:
+        """Kích thước input thực sự dùng cho imgsz yêu cầu"""
+        return imgsz or self.imgsz
+    
+    def predict_preprocessed(self, blob: np.ndarray, metas: list) -> List[np.ndarray]:
+        """
+        Chạy trên blob (N, 3, H, W) float32 0-1 RGB do LetterboxPreprocessor tạo
+        
+        Args:
+            blob: Input đã chuẩn bị
+            metas: (ratio, (pad_left, pad_top), (height, width)) của từng ảnh gốc
+        """
+        raise NotImplementedError
+
+class TorchBackend(DetectorBackend):
+    """
+    Backend PyTorch qua ultralytics.YOLO
+    
+    predict()/predict_batch(): letterbox và NMS do predictor của ultralytics
+    đảm nhận. predict_preprocessed(): gọi thẳng nn.Module với tensor dùng
+    chung bộ nhớ với blob (torch.from_numpy), bỏ qua preprocessing của
+    ultralytics, decode/NMS bằng NumPy.
+    """
+    
+    name = "torch"
+    supports_preprocessed = True
+    input_stride = 32
+    
+    def __init__(self, model_path: str, imgsz: int = 640,
+                 conf_threshold: float = 0.25, iou_threshold: float = 0.45,
+                 num_threads: Optional[int] = None, fuse: bool = True):
+        """
+        Args:
+            num_threads: Số thread intra-op của PyTorch (None = mặc định)
+            fuse: Gộp Conv+BN ngay khi load thay vì ở lần predict đầu tiên
+        """
+        import torch
+        from ultralytics import YOLO
+        
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        
+        self._torch = torch
+        self.model = YOLO(model_path)
+        if fuse:
+            self.model.fuse()
+        self.model.model.float().eval()
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+    
+    def predict(self, image: np.ndarray, imgsz: Optional[int] = None) -> np.ndarray:
+        with self._torch.inference_mode():
+            result = self.model(
+                image,
+                imgsz=imgsz or self.imgsz,
+                conf=self.conf_threshold,
+                iou=self.iou_threshold,
+                verbose=False
+            )[0]
+        return self._to_array(result)
+    
+    def predict_batch(self, images: List[np.ndarray], imgsz: Optional[int] = None
+                      ) -> List[np.ndarray]:
+        """Chạy cả batch trong một lượt forward"""
+        with self._torch.inference_mode():
+            results = self.model(
+                images,
+                imgsz=imgsz or self.imgsz,
+                conf=self.conf_threshold,
+                iou=self.iou_threshold,
+                verbose=False
+            )
+        return [self._to_array(result) for result in results]
+    
+    def predict_preprocessed(self, blob: np.ndarray, metas: list) -> List[np.ndarray]:
+        with self._torch.inference_mode():
+            output = self.model.model(self._torch.from_numpy(blob))
+        if isinstance(output, (list, tuple)):
+            output = output[0]  # (pred, feature maps) ở chế độ eval
+        output = output.numpy()
+        
+        return [
+            decode_predictions(output[i], ratio, pad_x, pad_y, shape,
+                               self.conf_threshold, self.iou_threshold)
+            for i, (ratio, (pad_x, pad_y), shape) in enumerate(metas)
+        ]
+    
+    @staticmethod
+    def _to_array(result) -> np.ndarray:
+        """Chuyển ultralytics Results sang mảng (N, 6)"""
+        boxes = result.boxes
+        return np.concatenate([
+            boxes.xyxy.cpu().numpy().reshape(-1, 4),
+            boxes.conf.cpu().numpy().reshape(-1, 1),
+            boxes.cls.cpu().numpy().reshape(-1, 1),
+        ], axis=1).astype(np.float32)
+
+class OnnxBackend(DetectorBackend):
+    """
+    Backend ONNX Runtime (CPUExecutionProvider), không cần PyTorch khi chạy
+    
+    Model .pt được export sang .onnx một lần và cache trong cache_dir với tên
+    <tên model>-<hash model>-<imgsz>-dynamic.onnx, các lần khởi động sau
+    dùng lại. Batch là trục động: số camera có chuyển động thay đổi lúc chạy
+    không cần export thêm (và không cần PyTorch/ultralytics lúc chạy).
+    """
+    
+    name = "onnx"
+    supports_preprocessed = True
+    
+    def __init__(self, model_path: str, imgsz: int = 640,
+                 conf_threshold: float = 0.25, iou_threshold: float = 0.45,
+                 num_threads: Optional[int] = None, cache_dir: str = "models"):
+        import onnxruntime as ort
+        
+        self.logger = setup_logger("OnnxBackend")
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.cache_dir = Path(cache_dir)
+        
+        self._ort = ort
+        self._options = ort.SessionOptions()
+        if num_threads:
+            self._options.intra_op_num_threads = num_threads
+        self._options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        
+        # Mỗi imgsz một session (batch động)
+        self._sessions = {}
+        session = self._get_session(imgsz)
+        
+        if self.model_path.endswith('.onnx'):
+            # File .onnx có sẵn (vd: model INT8) -> imgsz lấy theo input của model
+            input_size = session.get_inputs()[0].shape[2]
+            if isinstance(input_size, int) and input_size != imgsz:
+                self._sessions = {input_size: session}
+                self.imgsz = input_size
+    
+    def _get_session(self, imgsz: int):
+        """Lấy (hoặc tạo) session cho imgsz"""
+        session = self._sessions.get(imgsz)
+        if session is None:
+            if self.model_path.endswith('.onnx'):
+                onnx_path = self.model_path
+            else:
+                onnx_path = export_onnx(self.model_path, imgsz, self.cache_dir, self.logger,
+                                        dynamic=True)
+            
+            session = self._ort.InferenceSession(
+                str(onnx_path), self._options, providers=['CPUExecutionProvider']
+            )
+            self._sessions[imgsz] = session
+            self.logger.info(f"ONNX session sẵn sàng: {onnx_path}")
+        return session
+    
+    def predict(self, image: np.ndarray, imgsz: Optional[int] = None) -> np.ndarray:
+        return self.predict_batch([image], imgsz)[0]
+    
+    def resolve_imgsz(self, imgsz: Optional[int] = None) -> int:
+        # File .onnx có sẵn chỉ có một kích thước input
+        if self.model_path.endswith('.onnx'):
+            return self.imgsz
+        return imgsz or self.imgsz
+    
+    def predict_batch(self, images: List[np.ndarray], imgsz: Optional[int] = None
+                      ) -> List[np.ndarray]:
+        """Letterbox tất cả ảnh về cùng imgsz và chạy một lượt forward"""
+        imgsz = self.resolve_imgsz(imgsz)
+        prepared = [preprocess(image, imgsz) for image in images]
+        blob = np.stack([blob for blob, _, _ in prepared])
+        metas = [(ratio, pad, image.shape[:2]) for image, (_, ratio, pad) in zip(images, prepared)]
+        return self.predict_preprocessed(blob, metas)
+    
+    def predict_preprocessed(self, blob: np.ndarray, metas: list) -> List[np.ndarray]:
+        imgsz = blob.shape[2]
+        if self.model_path.endswith('.onnx') and len(blob) > 1:
+            # File .onnx có sẵn chỉ có batch 1
+            return [self.predict_preprocessed(blob[i:i + 1], metas[i:i + 1])[0]
+                    for i in range(len(blob))]
+        
+        session = self._get_session(imgsz)
+        output = session.run(None, {session.get_inputs()[0].name: blob})[0]
+        return [
+            decode_predictions(output[i], ratio, pad_x, pad_y, shape,
+                               self.conf_threshold, self.iou_threshold)
+            for i, (ratio, (pad_x, pad_y), shape) in enumerate(metas)
+        ]
+
+def export_onnx(model_path: str, imgsz: int, cache_dir: Path, logger=None,
+                dynamic: bool = False) -> Path:
+    """
+    Export model ultralytics .pt sang ONNX, có cache trên đĩa
+    
+    Key cache gồm hash nội dung model, imgsz và dynamic, nên đổi model hay
+    kích thước input đều tạo file mới.
+    
+    Args:
+        dynamic: Trục batch (và H/W) động thay vì cố định batch 1
+    """
+    logger = logger or setup_logger("OnnxBackend")
+    model_file = Path(model_path)
+    
+    # Model chưa có trên đĩa (vd: 'yolov8n.pt') -> để ultralytics tải về
+    if not model_file.exists():
+        from ultralytics import YOLO
+        YOLO(model_path)
+    
+    cache_dir = Path(cache_dir)
+    suffix = "-dynamic" if dynamic else ""
+    cache_path = cache_dir / f"{model_file.stem}-{file_hash(str(model_file))}-{imgsz}{suffix}.onnx"
+    if cache_path.exists():
+        logger.info(f"Dùng ONNX đã cache: {cache_path}")
+        return cache_path
+    
+    from ultralytics import YOLO
+    
+    logger.info(f"Đang export {model_path} sang ONNX (imgsz={imgsz}, dynamic={dynamic})...")
+    start = time.time()
+    exported = YOLO(str(model_file)).export(format='onnx', imgsz=imgsz, dynamic=dynamic)
+    
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(exported), cache_path)
+    logger.info(f"Đã export ONNX trong {time.time() - start:.1f}s: {cache_path}")
+    return cache_path
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+def create_backend(name: str, model_path: str, **kwargs) -> DetectorBackend:
+    """
+    Tạo backend theo tên ('torch' hoặc 'onnx')
+    
+    Raises:
+        ValueError: Nếu tên backend không hợp lệ
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: '{name}'. Chọn một trong: {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_path, **kwargs)
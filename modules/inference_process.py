@@ -0,0 +1,281 @@
+"""
+Inference Process - Chạy detector backend trong process riêng
+Frame đi qua ring buffer multiprocessing.shared_memory, chỉ mảng detection nhỏ đi ngược lại
+"""
+import multiprocessing as mp
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import List, Optional
+from utils.logger import setup_logger
+from modules.detector_backends import DetectorBackend, create_backend
+
+def _inference_worker(conn, backend_name: str, model_path: str, backend_options: dict):
+    """
+    Entry point của process inference
+    
+    Load backend một lần rồi phục vụ request qua Pipe cho tới khi nhận 'stop'.
+    Frame được đọc trực tiếp từ shared memory (view NumPy, không copy).
+    """
+    logger = setup_logger("InferenceProcess")
+    try:
+        start = time.time()
+        backend = create_backend(backend_name, model_path, **backend_options)
+        conn.send(('ready', time.time() - start))
+    except Exception as e:
+        conn.send(('error', f"Không thể load backend: {e}"))
+        return
+    
+    buffers = {}  # Tên shared memory -> SharedMemory đã attach
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break  # Process chính đã thoát
+            
+            command = message[0]
+            if command == 'stop':
+                break
+            if command == 'ping':
+                conn.send(('pong', mp.current_process().pid))
+                continue
+            
+            _, shm_name, frames, imgsz = message
+            try:
+                shm = buffers.get(shm_name)
+                if shm is None:
+                    # Ring buffer mới (process chính đổi kích thước) -> bỏ buffer cũ
+                    for old in buffers.values():
+                        old.close()
+                    shm = shared_memory.SharedMemory(name=shm_name)
+                    buffers = {shm_name: shm}
+                
+                images = [
+                    np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+                    for offset, shape in frames
+                ]
+                outputs = backend.predict_batch(images, imgsz)
+                del images  # Nhả view trước khi buffer có thể bị đóng
+                conn.send(('ok', outputs))
+            except Exception as e:
+                logger.error(f"Lỗi inference: {e}")
+                conn.send(('error', str(e)))
+    finally:
+        for shm in buffers.values():
+            shm.close()
+
+class ProcessBackend(DetectorBackend):
+    """
+    Chạy một backend khác (torch/onnx) trong process riêng
+    
+    Inference không còn tranh GIL với vòng đọc audio và render face. Frame
+    được ghi vào ring buffer shared memory gồm nhiều slot (mỗi slot đủ cho
+    một frame đầy đủ), process con đọc trực tiếp ra NumPy view; chiều về
+    chỉ là các mảng (N, 6).
+    
+    Vòng đời: start() (warm-up hoặc start_camera) / stop() (stop_camera),
+    healthy() để kiểm tra, process chết giữa chừng sẽ được khởi động lại.
+    """
+    
+    name = "process"
+    
+    def __init__(self,
+                 backend_name: str,
+                 model_path: str,
+                 backend_options: Optional[dict] = None,
+                 slots: int = 4,
+                 slot_shape=(480, 640, 3),
+                 timeout: float = 10.0,
+                 start_timeout: float = 300.0):
+        """
+        Args:
+            backend_name: Backend chạy trong process con ('torch', 'onnx')
+            model_path: Đường dẫn model
+            backend_options: Tham số cho create_backend
+            slots: Số slot trong ring buffer (>= số camera)
+            slot_shape: Kích thước frame lớn nhất dự kiến (H, W, C)
+            timeout: Thời gian chờ tối đa cho một lần inference (giây)
+            start_timeout: Thời gian chờ process con load model (giây)
+        """
+        self.logger = setup_logger("ProcessBackend")
+        self.backend_name = backend_name
+        self.model_path = model_path
+        self.backend_options = backend_options or {}
+        self.slots = slots
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        
+        self._slot_bytes = int(np.prod(slot_shape))
+        self._next_slot = 0
+        self._shm = None
+        self._process = None
+        self._conn = None
+        self._ctx = mp.get_context('spawn')  # Không fork process đang có thread
+        self._lock = threading.Lock()  # Pipe chỉ phục vụ một request tại một thời điểm
+        
+        self.restarts = 0
+        self.requests = 0
+    
+    def start(self):
+        """Tạo ring buffer và khởi động process inference"""
+        if self.is_alive():
+            return
+        
+        if self._shm is None:
+            self._allocate(self._slot_bytes)
+        
+        try:
+            self._spawn()
+        except BaseException:
+            # Không để lại process/shared memory mồ côi khi khởi động lỗi
+            self._kill()
+            self._free_shm()
+            raise
+    
+    def _spawn(self):
+        """Khởi động process con và chờ model load xong"""
+        self._conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(
+            target=_inference_worker,
+            args=(child_conn, self.backend_name, self.model_path, self.backend_options),
+            name="person-inference",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        
+        self.logger.info(f"Đang khởi động process inference (pid {self._process.pid})...")
+        if not self._conn.poll(self.start_timeout):
+            raise RuntimeError("Process inference không phản hồi khi load model!")
+        
+        try:
+            status, payload = self._conn.recv()
+        except EOFError:
+            status, payload = 'error', "Process inference thoát khi đang load model!"
+        if status != 'ready':
+            raise RuntimeError(payload)
+        
+        self.logger.info(f"Process inference sẵn sàng (load model {payload:.1f}s, "
+                         f"{self.slots} slot x {self._slot_bytes / 1e6:.1f}MB shared memory)")
+    
+    def stop(self):
+        """Dừng process và giải phóng shared memory"""
+        if self._process is not None:
+            if self._process.is_alive():
+                try:
+                    self._conn.send(('stop',))
+                except (BrokenPipeError, OSError):
+                    pass
+                self._process.join(timeout=3.0)
+            self._kill()
+            self.logger.info("Đã dừng process inference.")
+        
+        self._free_shm()
+    
+    def restart(self):
+        """Khởi động lại process (giữ nguyên ring buffer)"""
+        self.restarts += 1
+        self.logger.warning(f"Khởi động lại process inference (lần {self.restarts})...")
+        self._kill()
+        self.start()
+    
+    def is_alive(self) -> bool:
+        """Process con còn chạy không"""
+        return self._process is not None and self._process.is_alive()
+    
+    def healthy(self, timeout: float = 1.0) -> bool:
+        """Ping process con, True nếu trả lời trong timeout"""
+        with self._lock:
+            if not self.is_alive():
+                return False
+            try:
+                self._conn.send(('ping',))
+                if not self._conn.poll(timeout):
+                    return False
+                return self._conn.recv()[0] == 'pong'
+            except (BrokenPipeError, EOFError, OSError):
+                return False
+    
+    def _kill(self):
+        """Dừng hẳn process con và đóng pipe"""
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join(timeout=1.0)
+            self._process = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    def _free_shm(self):
+        """Đóng và xoá ring buffer shared memory"""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+    
+    def _allocate(self, slot_bytes: int):
+        """Tạo ring buffer mới với kích thước slot cho trước"""
+        self._free_shm()
+        self._slot_bytes = slot_bytes
+        self._shm = shared_memory.SharedMemory(create=True, size=slot_bytes * self.slots)
+        self._next_slot = 0
+    
+    def predict(self, image: np.ndarray, imgsz: Optional[int] = None) -> np.ndarray:
+        return self.predict_batch([image], imgsz)[0]
+    
+    def predict_batch(self, images: List[np.ndarray], imgsz: Optional[int] = None
+                      ) -> List[np.ndarray]:
+        """
+        Ghi batch vào các slot kế tiếp của ring buffer rồi chờ kết quả
+        
+        Raises:
+            RuntimeError: Process con lỗi/timeout (process sẽ được restart)
+        """
+        if len(images) > self.slots:
+            raise ValueError(f"Batch {len(images)} ảnh lớn hơn số slot ({self.slots})")
+        
+        with self._lock:
+            largest = max(image.nbytes for image in images)
+            if largest > self._slot_bytes:
+                # Frame lớn hơn dự kiến -> cấp lại ring buffer (process con tự attach lại)
+                self.logger.info(f"Tăng kích thước slot lên {largest / 1e6:.1f}MB")
+                self._allocate(largest)
+            
+            if not self.is_alive():
+                self.restart()
+            
+            frames = []
+            for image in images:
+                offset = self._next_slot * self._slot_bytes
+                self._next_slot = (self._next_slot + 1) % self.slots
+                view = np.ndarray(image.shape, dtype=np.uint8, buffer=self._shm.buf, offset=offset)
+                np.copyto(view, image)  # Một lần ghi duy nhất, crop ROI không cần copy trước
+                frames.append((offset, image.shape))
+            
+            self.requests += 1
+            try:
+                self._conn.send(('predict', self._shm.name, frames, imgsz))
+                status = 'pong'
+                while status == 'pong':  # Bỏ qua pong trễ của healthy() trước đó
+                    if not self._conn.poll(self.timeout):
+                        raise TimeoutError(f"Inference quá {self.timeout:.0f}s")
+                    status, payload = self._conn.recv()
+            except (BrokenPipeError, EOFError, OSError, TimeoutError) as e:
+                self.restart()
+                raise RuntimeError(f"Process inference lỗi: {e!r}")
+        
+        if status != 'ok':
+            raise RuntimeError(payload)
+        return payload
+    
+    def get_stats(self) -> dict:
+        """Thống kê process: pid, số request, số lần restart"""
+        return {
+            'pid': self._process.pid if self._process is not None else None,
+            'alive': self.is_alive(),
+            'requests': self.requests,
+            'restarts': self.restarts,
+        }
@@ -4,11 +4,53 @@ Sử dụng YOLOv8 trên camera IMX477
 """
 import cv2
 import numpy as np
-from ultralytics import YOLO
+import queue
+import threading
 import time
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 from utils.logger import setup_logger
 from utils.config_loader import get_config
+from modules.detector_backends import LetterboxPreprocessor, create_backend
+from modules.inference_process import ProcessBackend
+from modules.camera_stream import CameraStream, load_zones
+from modules.detection_scheduler import DetectionScheduler
+from utils.video_utils import create_frame_source
+
+@dataclass
+class PersonEvent:
+    """Sự kiện presence do detection worker phát ra"""
+    timestamp: float  # Thời điểm phát event (time.time())
+    frame_timestamp: float  # Thời điểm capture frame tương ứng
+    box: Tuple[float, float, float, float]  # (x1, y1, x2, y2)
+    confidence: float
+    latency: float  # timestamp - frame_timestamp (giây)
+    zone: str = ""  # Tên zone chứa người
+    track_id: Optional[int] = None  # ID track (nếu bật tracker)
+    camera: str = ""  # Tên camera
+
+@dataclass
+class ZoneDetection:
+    """Một người được xác nhận trong zone"""
+    box: Tuple[float, float, float, float]  # (x1, y1, x2, y2)
+    confidence: float
+    zone: str
+    track_id: Optional[int] = None
+
+@dataclass
+class FrameDetections:
+    """Kết quả YOLO của một frame dưới dạng mảng NumPy"""
+    boxes: np.ndarray  # (N, 4) x1, y1, x2, y2
+    scores: np.ndarray  # (N,) confidence
+    classes: np.ndarray  # (N,) class id
+    person_mask: np.ndarray  # (N,) class person và conf >= threshold
+    zone_hits: np.ndarray  # (Z, N) center của box nằm trong zone z
+
+class PersonEntered(PersonEvent):
+    """Có người bước vào zone"""
+
+class PersonLeft(PersonEvent):
+    """Người đã rời zone (box/confidence là lần thấy cuối cùng)"""
 
 class PersonDetector:
     """Phát hiện người xuất hiện trong vùng tương tác"""
@@ -28,73 +70,509 @@ class PersonDetector:
             self.config.get('camera.resolution.height', 480)
         )
         self.fps = self.config.get('camera.fps', 30)
-        
-        # Detection zone
-        self.zone_x = self.config.get('camera.detection_zone.x', 160)
-        self.zone_y = self.config.get('camera.detection_zone.y', 120)
-        self.zone_w = self.config.get('camera.detection_zone.width', 320)
-        self.zone_h = self.config.get('camera.detection_zone.height', 240)
+        self.use_capture_thread = self.config.get('camera.capture_thread', True)
+        self.sync_tolerance = self.config.get('camera.sync_tolerance', 0.05)
         
         # Person detection settings
         model_path = self.config.get('person_detection.model', 'yolov8n.pt')
         self.confidence_threshold = self.config.get('person_detection.confidence_threshold', 0.5)
         self.cooldown = self.config.get('person_detection.cooldown_seconds', 3)
+        self.leave_timeout = self.config.get('person_detection.leave_timeout', 1.0)
+        
+        # ROI: chỉ chạy YOLO trên vùng zone (+ margin) với imgsz nhỏ hơn
+        self.use_roi = self.config.get('person_detection.roi.enable', False)
+        self.roi_margin = self.config.get('person_detection.roi.margin', 32)
+        self.roi_imgsz = self.config.get('person_detection.roi.imgsz', 320)
+        
+        # Tracker: trigger khi một track ở trong zone đủ dwell_ms
+        self.dwell_time = self.config.get('person_detection.tracker.dwell_ms', 800) / 1000.0
+        self.detect_interval = self.config.get('person_detection.tracker.detect_interval', 0.0)
+        
+        # Các camera (mỗi camera có zone, motion gate, tracker riêng)
+        self.streams = self._create_streams()
+        
+        # Load YOLO model qua backend (torch hoặc onnx)
+        self.backend_name = self.config.get('person_detection.backend', 'torch')
+        if model_path.endswith('.onnx') and self.backend_name == 'torch':
+            # Model đã export/quantize (vd: INT8) -> chạy bằng ONNX Runtime
+            self.backend_name = 'onnx'
+        self.imgsz = self.config.get('person_detection.imgsz', 640)
+        backend_options = dict(self.config.get(f'person_detection.{self.backend_name}') or {})
+        backend_options.update(
+            imgsz=self.imgsz,
+            iou_threshold=self.config.get('person_detection.iou_threshold', 0.45)
+        )
+        
+        if self.config.get('person_detection.out_of_process.enable', False):
+            # Model chạy trong process riêng, load khi start_camera()
+            self.logger.info(f"Inference trong process riêng (backend: {self.backend_name})")
+            self.backend = ProcessBackend(
+                self.backend_name,
+                model_path,
+                backend_options,
+                slots=max(len(self.streams), self.config.get('person_detection.out_of_process.slots', 4)),
+                slot_shape=(self.resolution[1], self.resolution[0], 3),
+                timeout=self.config.get('person_detection.out_of_process.timeout', 10.0)
+            )
+        else:
+            self.logger.info(f"Đang load model {model_path} (backend: {self.backend_name})...")
+            self.backend = create_backend(self.backend_name, model_path, **backend_options)
+        self._model_lock = threading.Lock()  # Model dùng chung giữa worker và preview
         
-        # Load YOLO model
-        self.logger.info(f"Đang load model {model_path}...")
-        self.model = YOLO(model_path)
+        # Letterbox vào buffer cấp phát sẵn (chỉ dùng dưới _model_lock)
+        self.preprocessor = None
+        if (self.config.get('person_detection.preallocated_preprocess', True) and
+                self.backend.supports_preprocessed):
+            self.preprocessor = LetterboxPreprocessor()
         
-        # Camera
-        self.cap = None
-        self.last_detection_time = 0
+        self.camera_started = False
+        self.last_detection_time = None  # Timestamp frame của lần trigger gần nhất
+        self.sync_skew = 0.0  # Chênh lệch timestamp giữa các camera trong batch gần nhất
         
-        self.logger.info("PersonDetector đã sẵn sàng!")
+        # Duty-cycle: tần suất detection theo trạng thái scene/bot
+        self.scheduler = DetectionScheduler(
+            idle_hz=self.config.get('person_detection.scheduler.idle_hz', 2.0),
+            active_hz=self.config.get('person_detection.scheduler.active_hz', 10.0),
+            hold_time=self.config.get('person_detection.scheduler.hold_time', 3.0),
+            enable=self.config.get('person_detection.scheduler.enable', False)
+        )
+        
+        # Detection worker (chạy inference riêng, phát PersonEntered/PersonLeft)
+        self.events = queue.Queue(maxsize=100)
+        self._worker_thread = None
+        self._worker_running = False
+        
+        # Ping process inference định kỳ (chỉ khi out_of_process), treo -> restart
+        self.health_interval = self.config.get('person_detection.out_of_process.health_interval', 5.0)
+        self._last_health_check = time.time()
+        
+        # Warm-up: lần inference đầu chậm hơn nhiều (khởi tạo lazy, cấp phát, cache)
+        self.warmup_runs = self.config.get('person_detection.warmup.runs', 5)
+        self.warmup_stats = {}
+        self._warmup_thread = None
+        
+        self.logger.info(f"PersonDetector đã sẵn sàng! ({len(self.streams)} camera)")
+        
+        if self.config.get('person_detection.warmup.background', True):
+            self.start_warmup()
+        else:
+            self.warmup()
+    
+    def _create_streams(self) -> List[CameraStream]:
+        """
+        Tạo CameraStream từ config
+        
+        camera.sources là list {name, device_id | video | images, detection_zone | zones}.
+        Nếu không có, dùng camera.device_id với camera.detection_zone/zones.
+        """
+        motion_gate_options = None
+        if self.config.get('person_detection.motion_gate.enable', False):
+            motion_gate_options = {
+                'width': self.config.get('person_detection.motion_gate.width', 80),
+                'threshold': self.config.get('person_detection.motion_gate.threshold', 0.01),
+                'pixel_threshold': self.config.get('person_detection.motion_gate.pixel_threshold', 25),
+                'alpha': self.config.get('person_detection.motion_gate.alpha', 0.05),
+                'force_interval': self.config.get('person_detection.motion_gate.force_interval', 5.0),
+            }
+        
+        tracker_options = None
+        if self.config.get('person_detection.tracker.enable', False):
+            tracker_options = {
+                'iou_threshold': self.config.get('person_detection.tracker.iou_threshold', 0.3),
+                'high_threshold': self.confidence_threshold,
+                'low_threshold': self.config.get('person_detection.tracker.low_threshold', 0.25),
+                'max_age': self.config.get('person_detection.tracker.max_age', 1.0),
+            }
+        
+        sources = self.config.get('camera.sources')
+        if not sources:
+            sources = [{
+                'name': str(self.camera_id),
+                'device_id': self.camera_id,
+                'detection_zone': self.config.get('camera.detection_zone'),
+                'zones': self.config.get('camera.zones'),
+            }]
+        
+        streams = []
+        for i, source in enumerate(sources):
+            if not (source.get('video') or source.get('images')):
+                source = dict(source, device_id=source.get('device_id', i))
+            streams.append(CameraStream(
+                name=str(source.get('name', source.get('device_id', i))),
+                source=create_frame_source(source, self.resolution, self.fps),
+                zones=load_zones(source.get('zones'), source.get('detection_zone')),
+                resolution=self.resolution,
+                use_capture_thread=self.use_capture_thread,
+                motion_gate_options=motion_gate_options,
+                tracker_options=tracker_options
+            ))
+        return streams
+    
+    @property
+    def person_present(self) -> bool:
+        """Có người trong zone của bất kỳ camera nào"""
+        return any(stream.person_present for stream in self.streams)
     
     def start_camera(self):
-        """Khởi động camera"""
-        if self.cap is not None:
+        """Khởi động tất cả camera"""
+        if self.camera_started:
             self.logger.warning("Camera đã được khởi động rồi!")
             return
         
-        self.logger.info(f"Đang khởi động camera {self.camera_id}...")
-        self.cap = cv2.VideoCapture(self.camera_id)
-        
-        if not self.cap.isOpened():
-            self.logger.error(f"Không thể mở camera {self.camera_id}")
-            self.logger.error("Hãy chạy: python test_camera.py để tìm device ID đúng")
-            raise RuntimeError(f"Không thể mở camera {self.camera_id}")
-        
-        # Set resolution (sau khi mở thành công)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
-        self.cap.set(cv2.CAP_PROP_FPS, self.fps)
-        
-        # Kiểm tra thực tế resolution đã set
-        actual_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        actual_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        actual_fps = self.cap.get(cv2.CAP_PROP_FPS)
-        
-        self.logger.info(f"Camera đã sẵn sàng! Resolution: {actual_width}x{actual_height} @ {actual_fps:.1f}fps")
-        
-        # Test đọc frame đầu tiên
-        ret, test_frame = self.cap.read()
-        if not ret:
-            self.logger.warning("Cảnh báo: Camera mở được nhưng chưa đọc được frame. Đợi vài giây...")
-            import time
-            time.sleep(2)
-            ret, test_frame = self.cap.read()
-            if ret:
-                self.logger.info("✅ Camera đã sẵn sàng sau khi đợi!")
-            else:
-                self.logger.error("❌ Vẫn không đọc được frame. Kiểm tra camera!")
+        try:
+            for stream in self.streams:
+                stream.open(self.logger)
+            with self._model_lock:  # Warm-up có thể đang start backend
+                self.backend.start()
+        except Exception:
+            for stream in self.streams:
+                stream.close(self.logger)
+            self.backend.stop()
+            raise
+        
+        self.camera_started = True
     
     def stop_camera(self):
         """Dừng camera"""
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        self.stop_worker()
+        self.wait_warmup()
+        
+        for stream in self.streams:
+            stream.close(self.logger)
+            if stream.tracker is not None:
+                stream.tracker.reset()  # Track cũ không còn đúng khi mở lại camera
+        self.backend.stop()
+        
+        if self.camera_started:
+            self.camera_started = False
             self.logger.info("Đã dừng camera.")
     
+    def get_camera_stats(self) -> List[dict]:
+        """Thống kê từng camera (presence, FPS capture/inference, motion gate...)"""
+        return [stream.get_stats() for stream in self.streams]
+    
+    def get_backend_stats(self) -> dict:
+        """Thống kê process inference (nếu bật out_of_process)"""
+        if isinstance(self.backend, ProcessBackend):
+            return self.backend.get_stats()
+        return {'backend': self.backend.name}
+    
+    def get_scheduler_stats(self) -> dict:
+        """Chế độ scheduler, tần suất detection mục tiêu và thực tế (Hz)"""
+        return self.scheduler.get_stats()
+    
+    def pause(self):
+        """Tạm dừng detection (bot đang LISTENING/THINKING/SPEAKING)"""
+        self.scheduler.pause()
+    
+    def resume(self):
+        """Chạy lại detection sau khi hội thoại kết thúc"""
+        self.scheduler.resume()
+    
+    def warmup(self, runs: Optional[int] = None) -> dict:
+        """
+        Chạy model trên frame giả (đúng kích thước camera, ROI và batch như
+        lúc chạy thật) để lần detect_person_in_zone() đầu tiên không phải
+        trả chi phí khởi tạo
+        
+        Args:
+            runs: Số lần chạy (mặc định: person_detection.warmup.runs)
+        
+        Returns:
+            Thống kê warm-up (cũng lưu ở self.warmup_stats)
+        """
+        runs = self.warmup_runs if runs is None else runs
+        if runs <= 0:
+            return {}
+        
+        try:
+            with self._model_lock:
+                self.backend.start()
+            
+            width, height = self.resolution
+            frame = np.full((height, width, 3), 114, dtype=np.uint8)
+            inputs, _ = self._prepare_inputs(self.streams, [frame] * len(self.streams))
+            
+            latencies = []
+            start = time.time()
+            for _ in range(runs):
+                run_start = time.perf_counter()
+                self._infer(inputs)
+                latencies.append((time.perf_counter() - run_start) * 1000)
+            elapsed = time.time() - start
+        except Exception as e:
+            self.logger.warning(f"Warm-up detector lỗi: {e}")
+            return {}
+        
+        # Latency ổn định: median nửa sau (bỏ các lần còn đang khởi tạo)
+        steady = float(np.median(latencies[len(latencies) // 2:]))
+        self.warmup_stats = {
+            'runs': runs,
+            'warmup_time': round(elapsed, 3),
+            'first_ms': round(latencies[0], 1),
+            'steady_ms': round(steady, 1),
+        }
+        self.logger.info(f"Warm-up detector xong: {runs} lần trong {elapsed:.2f}s "
+                         f"(lần đầu {latencies[0]:.0f}ms, ổn định {steady:.0f}ms)")
+        return self.warmup_stats
+    
+    def start_warmup(self):
+        """Warm-up trong thread riêng, song song với khởi tạo các module khác"""
+        if self._warmup_thread is not None and self._warmup_thread.is_alive():
+            return
+        self._warmup_thread = threading.Thread(
+            target=self.warmup,
+            name="PersonDetectorWarmup",
+            daemon=True
+        )
+        self._warmup_thread.start()
+    
+    def wait_warmup(self, timeout: Optional[float] = None) -> bool:
+        """Chờ warm-up chạy nền xong, True nếu đã xong"""
+        if self._warmup_thread is not None:
+            self._warmup_thread.join(timeout)
+            return not self._warmup_thread.is_alive()
+        return True
+    
+    def _prepare_inputs(self, streams: List[CameraStream], frames: List[np.ndarray]
+                        ) -> Tuple[List[np.ndarray], list]:
+        """Input cho model (crop ROI nếu bật) và offset map box về frame gốc"""
+        inputs, offsets = [], []
+        for stream, frame in zip(streams, frames):
+            if self.use_roi:
+                # Crop zone + margin, chạy ở imgsz nhỏ rồi map box về toạ độ frame gốc
+                x1, y1, x2, y2 = stream.roi_bounds(frame.shape, self.roi_margin)
+                inputs.append(frame[y1:y2, x1:x2])
+                offsets.append(np.array([x1, y1, x1, y1], dtype=np.float32))
+            else:
+                inputs.append(frame)
+                offsets.append(None)
+        return inputs, offsets
+    
+    def _infer(self, inputs: List[np.ndarray]) -> List[np.ndarray]:
+        """Một lượt forward cho cả batch, trả về mảng (N, 6) cho từng input"""
+        imgsz = self.roi_imgsz if self.use_roi else None
+        with self._model_lock:
+            if self.preprocessor is not None:
+                blob, metas = self.preprocessor(inputs, self.backend.resolve_imgsz(imgsz),
+                                                self.backend.input_stride)
+                return self.backend.predict_preprocessed(blob, metas)
+            if len(inputs) == 1:
+                return [self.backend.predict(inputs[0], imgsz=imgsz)]
+            return self.backend.predict_batch(inputs, imgsz=imgsz)
+    
+    def _analyze_frames(self, streams: List[CameraStream], frames: List[np.ndarray]
+                        ) -> List[FrameDetections]:
+        """
+        Chạy backend trên một batch frame (mỗi camera một frame) và tính mask
+        class/confidence/zone cho toàn bộ box cùng lúc
+        
+        Nhiều camera chỉ tốn một lượt forward của model. Chi phí Python
+        không phụ thuộc số người trong frame.
+        """
+        inputs, offsets = self._prepare_inputs(streams, frames)
+        outputs = self._infer(inputs)
+        
+        results = []
+        for stream, frame, detections, offset in zip(streams, frames, outputs, offsets):
+            if offset is not None:
+                detections[:, :4] += offset
+            
+            boxes = detections[:, :4]
+            scores = detections[:, 4]
+            classes = detections[:, 5].astype(np.int32)
+            
+            # Class 0 là 'person' trong COCO dataset
+            person_mask = (classes == 0) & (scores >= self.confidence_threshold)
+            zone_hits = stream.zone_membership(boxes, frame.shape)
+            
+            stream.record_inference()
+            results.append(FrameDetections(boxes, scores, classes, person_mask, zone_hits))
+        
+        return results
+    
+    def _best_in_zone(self, stream: CameraStream, detections: FrameDetections
+                      ) -> Optional[ZoneDetection]:
+        """
+        Chọn người có confidence cao nhất có center nằm trong một zone
+        
+        Returns:
+            ZoneDetection hoặc None
+        """
+        candidates = detections.person_mask & detections.zone_hits.any(axis=0)
+        if not candidates.any():
+            return None
+        
+        scores = np.where(candidates, detections.scores, -1.0)
+        best = int(np.argmax(scores))
+        zone_index = int(np.argmax(detections.zone_hits[:, best]))
+        
+        x1, y1, x2, y2 = detections.boxes[best]
+        return ZoneDetection(
+            box=(float(x1), float(y1), float(x2), float(y2)),
+            confidence=float(detections.scores[best]),
+            zone=stream.zones[zone_index][0]
+        )
+    
+    def _dwelled_track(self, stream: CameraStream, frame_shape, frame_timestamp: float
+                       ) -> Optional[ZoneDetection]:
+        """
+        Tìm track đã ở trong zone đủ dwell_time
+        
+        Track chưa trigger được ưu tiên hơn track đã trigger: người mới vào
+        zone không bị che bởi người cũ (confidence cao hơn) vẫn đang đứng đó.
+        
+        Returns:
+            ZoneDetection của track đã dwell đủ (chưa trigger, confidence cao
+            nhất), hoặc None
+        """
+        tracks = stream.tracker.tracks
+        if not tracks:
+            return None
+        
+        boxes = np.array([t.box for t in tracks], dtype=np.float32)
+        zone_hits = stream.zone_membership(boxes, frame_shape)
+        
+        best = None
+        for i, track in enumerate(tracks):
+            if not zone_hits[:, i].any():
+                track.zone_enter_time = None
+                continue
+            
+            if track.zone_enter_time is None:
+                track.zone_enter_time = frame_timestamp
+            
+            if frame_timestamp - track.zone_enter_time < self.dwell_time:
+                continue
+            rank = (track.track_id not in stream.triggered_tracks, track.score)
+            if best is None or rank > best[0]:
+                best = (rank, track, int(np.argmax(zone_hits[:, i])))
+        
+        if best is None:
+            return None
+        
+        _, track, zone_index = best
+        x1, y1, x2, y2 = track.box
+        return ZoneDetection(
+            box=(float(x1), float(y1), float(x2), float(y2)),
+            confidence=track.score,
+            zone=stream.zones[zone_index][0],
+            track_id=track.track_id
+        )
+    
+    def _process_frames(self, batch: List[Tuple[CameraStream, np.ndarray, float]]
+                        ) -> List[Tuple[CameraStream, bool, Optional[ZoneDetection]]]:
+        """
+        Chạy pipeline cho một batch frame: motion gate -> detector -> tracker
+        
+        Chỉ những camera cần chạy detector mới được gom vào batch inference.
+        Với tracker, detector chỉ chạy mỗi detect_interval giây; giữa các lần
+        đó track được nội suy theo vận tốc, nên có thể giảm tần suất YOLO mà
+        không mất ID.
+        
+        Returns:
+            List (stream, updated, detection) - updated=False nếu frame bị bỏ
+            qua (scene tĩnh), khi đó trạng thái trước đó vẫn giữ nguyên
+        """
+        to_detect = []
+        for stream, frame, frame_timestamp in batch:
+            if stream.tracker is not None:
+                due = (stream.last_detect_time is None or
+                       frame_timestamp - stream.last_detect_time >= self.detect_interval)
+                if not due:
+                    continue
+            if stream.should_run_detector(frame, frame_timestamp):
+                to_detect.append((stream, frame, frame_timestamp))
+        
+        detections = {}
+        if to_detect:
+            analyzed = self._analyze_frames([b[0] for b in to_detect], [b[1] for b in to_detect])
+            for (stream, _, _), result in zip(to_detect, analyzed):
+                detections[id(stream)] = result
+        
+        results = []
+        active = False
+        for stream, frame, frame_timestamp in batch:
+            result = detections.get(id(stream))
+            
+            if stream.tracker is not None:
+                if result is not None:
+                    stream.last_detect_time = frame_timestamp
+                    persons = result.classes == 0
+                    stream.tracker.update(
+                        result.boxes[persons], result.scores[persons], frame_timestamp
+                    )
+                else:
+                    stream.tracker.propagate(frame_timestamp)
+                results.append((stream, True,
+                                self._dwelled_track(stream, frame.shape, frame_timestamp)))
+            elif result is not None:
+                results.append((stream, True, self._best_in_zone(stream, result)))
+            else:
+                results.append((stream, False, None))
+            
+            active = active or results[-1][2] is not None or stream.is_active()
+            
+            # Cache cho preview: chỉ giữ reference, việc copy và vẽ do preview làm.
+            # Frame không chạy YOLO (motion gate/scheduler) không mang box cũ
+            # (lệch so với frame mới), chỉ vẽ track đã nội suy tới frame này
+            tracks = [(t.track_id, t.box) for t in stream.tracker.tracks] if stream.tracker else []
+            stream.last_result = (frame, frame_timestamp, result, tracks)
+        
+        self.scheduler.tick(active)
+        return results
+    
+    def _read_batch(self, wait: bool = False) -> List[Tuple[CameraStream, np.ndarray, float]]:
+        """
+        Đọc frame mới từ tất cả camera và đồng bộ theo timestamp
+        
+        Camera có frame cũ hơn frame mới nhất quá sync_tolerance sẽ được đợi
+        thêm một frame. Camera không có frame mới thì bị bỏ khỏi batch.
+        """
+        batch = []
+        for stream in self.streams:
+            ret, frame, seq, frame_timestamp = stream.read_frame(wait=wait)
+            if not ret:
+                # Capture thread chưa có frame đầu tiên (lỗi đọc được đếm trong stats),
+                # nguồn replay hết frame thì không phải lỗi
+                if stream.capture is None and not stream.source.exhausted:
+                    self._log_read_error(stream)
+                continue
+            
+            # Frame mới nhất đã được xử lý rồi -> không cần chạy lại YOLO
+            if seq == stream.last_frame_seq:
+                continue
+            stream.last_frame_seq = seq
+            batch.append([stream, frame, frame_timestamp])
+        
+        if len(batch) > 1:
+            newest = max(item[2] for item in batch)
+            for item in batch:
+                stream = item[0]
+                if newest - item[2] > self.sync_tolerance and stream.capture is not None:
+                    ret, frame, seq, frame_timestamp = stream.read_frame(
+                        wait=True, timeout=self.sync_tolerance
+                    )
+                    if ret and seq != stream.last_frame_seq:
+                        stream.last_frame_seq = seq
+                        item[1], item[2] = frame, frame_timestamp
+            
+            timestamps = [item[2] for item in batch]
+            self.sync_skew = max(timestamps) - min(timestamps)
+        
+        return [tuple(item) for item in batch]
+    
+    def _log_read_error(self, stream: CameraStream):
+        """Log hướng dẫn khi không đọc được frame"""
+        self.logger.error(f"Không thể đọc frame từ {stream.source.label}!")
+        if not stream.source.live:
+            return
+        self.logger.error("Có thể do:")
+        self.logger.error("  1. Camera device ID sai (kiểm tra: python test_camera.py)")
+        self.logger.error("  2. Camera đang bị process khác sử dụng")
+        self.logger.error("  3. Camera cần thời gian khởi động (thử đợi vài giây)")
+        self.logger.error("  4. Permissions (thử: sudo chmod 666 /dev/video*)")
+    
     def detect_person_in_zone(self) -> bool:
         """
         Kiểm tra xem có người trong vùng detection không
@@ -102,100 +580,321 @@ class PersonDetector:
         Returns:
             True nếu phát hiện người trong zone
         """
-        if self.cap is None:
+        if not self.camera_started:
             self.logger.error("Camera chưa được khởi động!")
             return False
         
-        # Kiểm tra cooldown
-        current_time = time.time()
-        if current_time - self.last_detection_time < self.cooldown:
-            return False
+        return bool(self._detect_triggers())
+    
+    def _detect_triggers(self) -> List[Tuple[CameraStream, float, ZoneDetection]]:
+        """
+        Đọc một batch frame, chạy pipeline và áp dụng cooldown/trigger theo track
         
-        # Đọc frame
-        ret, frame = self.cap.read()
-        if not ret:
-            self.logger.error(f"Không thể đọc frame từ camera {self.camera_id}!")
-            self.logger.error("Có thể do:")
-            self.logger.error("  1. Camera device ID sai (kiểm tra: python test_camera.py)")
-            self.logger.error("  2. Camera đang bị process khác sử dụng")
-            self.logger.error("  3. Camera cần thời gian khởi động (thử đợi vài giây)")
-            self.logger.error("  4. Permissions (thử: sudo chmod 666 /dev/video*)")
-            return False
+        Cooldown tính theo timestamp của frame nên replay cho kết quả như
+        camera thật bất kể tốc độ đọc.
         
-        # Run detection
-        results = self.model(frame, verbose=False)
-        
-        # Kiểm tra từng detection
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Class 0 là 'person' trong COCO dataset
-                if int(box.cls[0]) == 0 and float(box.conf[0]) >= self.confidence_threshold:
-                    # Lấy bounding box
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    
-                    # Tính center của bounding box
-                    center_x = (x1 + x2) / 2
-                    center_y = (y1 + y2) / 2
-                    
-                    # Kiểm tra xem center có trong zone không
-                    if (self.zone_x <= center_x <= self.zone_x + self.zone_w and
-                        self.zone_y <= center_y <= self.zone_y + self.zone_h):
-                        
-                        self.logger.info(f"✅ Phát hiện người trong zone! (confidence: {box.conf[0]:.2f})")
-                        self.last_detection_time = current_time
-                        return True
+        Returns:
+            List (stream, frame_timestamp, detection) cho mỗi trigger
+        """
+        # Chưa tới lượt theo duty-cycle (hoặc đang pause)
+        if not self.scheduler.due():
+            return []
+        
+        # Đọc frame và run detection
+        batch = self._read_batch()
+        if not batch:
+            return []
+        
+        # Kiểm tra cooldown (tracker tự chống trigger lặp theo track ID,
+        # và cần frame liên tục để giữ track)
+        frame_time = max(b[2] for b in batch)
+        use_tracker = any(stream.tracker is not None for stream in self.streams)
+        if (not use_tracker and self.last_detection_time is not None and
+                frame_time - self.last_detection_time < self.cooldown):
+            return []
         
-        return False
+        triggers = []
+        for stream, _, detection in self._process_frames(batch):
+            if detection is None:
+                continue
+            
+            # Mỗi track chỉ trigger một lần
+            if detection.track_id is not None:
+                stream.triggered_tracks &= {t.track_id for t in stream.tracker.tracks}
+                if detection.track_id in stream.triggered_tracks:
+                    continue
+                stream.triggered_tracks.add(detection.track_id)
+            
+            self.logger.info(f"✅ Phát hiện người trong zone '{detection.zone}' "
+                             f"(camera '{stream.name}')! (confidence: {detection.confidence:.2f})")
+            frame_timestamp = next(b[2] for b in batch if b[0] is stream)
+            triggers.append((stream, frame_timestamp, detection))
+        
+        if triggers:
+            self.last_detection_time = frame_time
+        return triggers
     
-    def get_frame_with_visualization(self) -> Optional[np.ndarray]:
+    def run_replay(self) -> dict:
+        """
+        Chạy toàn bộ pipeline (motion gate, inference, zone, cooldown/tracker)
+        trên nguồn replay (camera.sources với video/images) tới khi hết frame
+        
+        Scheduler bị tắt trong lúc replay để mọi frame đều đi qua pipeline,
+        nên kết quả chỉ phụ thuộc vào footage và config.
+        
+        Returns:
+            Dict: frames, duration (giây), fps, triggers (list dict với
+            timestamp media, camera, zone, confidence, track_id)
+        """
+        if any(stream.source.live for stream in self.streams):
+            raise RuntimeError("Replay chỉ dùng với nguồn video/thư mục ảnh!")
+        
+        if not self.camera_started:
+            self.start_camera()
+        
+        for stream in self.streams:
+            if stream.tracker is not None:
+                stream.tracker.reset()
+        
+        scheduler_enable = self.scheduler.enable
+        self.scheduler.enable = False
+        
+        triggers = []
+        start = time.time()
+        try:
+            while not all(stream.source.exhausted for stream in self.streams):
+                for stream, frame_timestamp, detection in self._detect_triggers():
+                    triggers.append({
+                        'timestamp': round(frame_timestamp, 3),
+                        'camera': stream.name,
+                        'zone': detection.zone,
+                        'confidence': round(detection.confidence, 3),
+                        'track_id': detection.track_id,
+                    })
+        finally:
+            self.scheduler.enable = scheduler_enable
+        
+        duration = time.time() - start
+        frames = sum(stream.last_frame_seq for stream in self.streams)
+        fps = frames / duration if duration > 0 else 0.0
+        self.logger.info(f"Replay xong: {frames} frame trong {duration:.1f}s "
+                         f"({fps:.1f} FPS), {len(triggers)} trigger")
+        
+        return {
+            'frames': frames,
+            'duration': round(duration, 3),
+            'fps': round(fps, 1),
+            'triggers': triggers,
+        }
+    
+    def get_frame_with_visualization(self, camera: int = 0) -> Optional[np.ndarray]:
         """
         Lấy frame với visualization (boxes và zone)
         Dùng cho debug/display
         
+        Vẽ từ frame + kết quả detection cuối cùng mà pipeline đã xử lý
+        (detect_person_in_zone hoặc worker), không đọc frame hay chạy YOLO
+        thêm lần nào, nên preview hiển thị đúng frame đã trigger.
+        
+        Args:
+            camera: Index camera trong danh sách sources
+        
         Returns:
-            Frame với visualization hoặc None
+            Frame với visualization hoặc None nếu chưa có frame nào được xử lý
         """
-        if self.cap is None:
+        if not self.camera_started:
             return None
         
-        ret, frame = self.cap.read()
-        if not ret:
+        stream = self.streams[camera]
+        if stream.last_result is None:
             return None
         
-        # Vẽ detection zone
-        cv2.rectangle(
-            frame,
-            (self.zone_x, self.zone_y),
-            (self.zone_x + self.zone_w, self.zone_y + self.zone_h),
-            (0, 255, 0), 2
-        )
+        # Frame trong cache dùng chung với pipeline -> vẽ trên bản copy
+        frame, _, detections, tracks = stream.last_result
+        frame = frame.copy()
         
-        # Run detection và vẽ boxes
-        results = self.model(frame, verbose=False)
+        # Vẽ các detection zone
+        for name, polygon in stream.zones:
+            cv2.polylines(frame, [polygon], True, (0, 255, 0), 2)
+            x, y = polygon[0]
+            cv2.putText(frame, name, (int(x) + 4, int(y) + 16),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
         
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                if int(box.cls[0]) == 0:  # person
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    conf = float(box.conf[0])
-                    
-                    # Màu: xanh nếu trong zone, đỏ nếu ngoài zone
-                    center_x = (x1 + x2) / 2
-                    center_y = (y1 + y2) / 2
-                    in_zone = (self.zone_x <= center_x <= self.zone_x + self.zone_w and
-                              self.zone_y <= center_y <= self.zone_y + self.zone_h)
-                    
-                    color = (0, 255, 0) if in_zone else (0, 0, 255)
-                    
-                    # Vẽ box
-                    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
-                    cv2.putText(frame, f"Person {conf:.2f}", (int(x1), int(y1)-10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        # Vùng ROI thực sự đưa vào YOLO
+        if self.use_roi:
+            x1, y1, x2, y2 = stream.roi_bounds(frame.shape, self.roi_margin)
+            cv2.rectangle(frame, (x1, y1), (x2 - 1, y2 - 1), (255, 255, 0), 1)
+        
+        # Vẽ boxes: xanh nếu trong zone, đỏ nếu ngoài zone
+        if detections is not None:
+            in_zone = detections.zone_hits.any(axis=0)
+            for i in np.flatnonzero(detections.classes == 0):  # person
+                x1, y1, x2, y2 = detections.boxes[i].astype(int)
+                color = (0, 255, 0) if in_zone[i] else (0, 0, 255)
+                
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+                cv2.putText(frame, f"Person {detections.scores[i]:.2f}", (x1, y1-10),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        
+        # Vị trí track (đã nội suy tới frame hiện tại) kèm ID
+        for track_id, box in tracks:
+            x1, y1, x2, y2 = box.astype(int)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 255), 1)
+            cv2.putText(frame, f"#{track_id}", (x1, y2 + 14),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 1)
         
         return frame
     
+    def start_worker(self):
+        """
+        Chạy inference trong worker thread riêng
+        
+        Worker phát PersonEntered/PersonLeft vào self.events, orchestrator
+        chỉ cần tiêu thụ event (get_event) thay vì gọi YOLO inline.
+        """
+        if self._worker_running:
+            self.logger.warning("Detection worker đã chạy rồi!")
+            return
+        
+        if not self.camera_started:
+            raise RuntimeError("Camera chưa được khởi động!")
+        
+        self._worker_running = True
+        self._worker_thread = threading.Thread(
+            target=self._worker_loop,
+            name="person-detector",
+            daemon=True
+        )
+        self._worker_thread.start()
+        self.logger.info("Đã bật detection worker.")
+    
+    def stop_worker(self):
+        """Dừng detection worker"""
+        if not self._worker_running:
+            return
+        
+        self._worker_running = False
+        if self._worker_thread is not None:
+            self._worker_thread.join(timeout=2.0)
+            self._worker_thread = None
+        self.logger.info("Đã dừng detection worker.")
+    
+    @property
+    def worker_running(self) -> bool:
+        """Worker có đang chạy không"""
+        return self._worker_running
+    
+    def get_event(self, timeout: Optional[float] = None) -> Optional[PersonEvent]:
+        """
+        Lấy event tiếp theo từ worker
+        
+        Args:
+            timeout: Thời gian chờ (giây), None/0 = không chờ
+        
+        Returns:
+            PersonEntered/PersonLeft hoặc None nếu chưa có event
+        """
+        try:
+            if timeout:
+                return self.events.get(timeout=timeout)
+            return self.events.get_nowait()
+        except queue.Empty:
+            return None
+    
+    def _publish(self, event: PersonEvent):
+        """Đưa event vào queue, bỏ event cũ nhất nếu queue đầy"""
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                except queue.Empty:
+                    pass
+    
+    def _update_presence(self, stream: CameraStream, detection: Optional[ZoneDetection],
+                         frame_timestamp: float):
+        """
+        Cập nhật trạng thái presence của một camera từ kết quả detection
+        
+        PersonLeft chỉ được phát khi không thấy người liên tục trong
+        leave_timeout giây, tránh nhấp nháy khi YOLO miss vài frame.
+        """
+        now = time.time()
+        
+        if detection is not None:
+            stream.last_seen = (frame_timestamp, detection)
+            if not stream.person_present:
+                stream.person_present = True
+                self.logger.info(f"✅ Người bước vào zone '{detection.zone}' "
+                                 f"(camera '{stream.name}')! (confidence: {detection.confidence:.2f})")
+                self._publish(PersonEntered(
+                    timestamp=now,
+                    frame_timestamp=frame_timestamp,
+                    box=detection.box,
+                    confidence=detection.confidence,
+                    latency=now - frame_timestamp,
+                    zone=detection.zone,
+                    track_id=detection.track_id,
+                    camera=stream.name
+                ))
+            return
+        
+        if stream.person_present and frame_timestamp - stream.last_seen[0] >= self.leave_timeout:
+            stream.person_present = False
+            _, last = stream.last_seen
+            self.logger.info(f"Người đã rời zone '{last.zone}' (camera '{stream.name}').")
+            self._publish(PersonLeft(
+                timestamp=now,
+                frame_timestamp=frame_timestamp,
+                box=last.box,
+                confidence=last.confidence,
+                latency=now - frame_timestamp,
+                zone=last.zone,
+                track_id=last.track_id,
+                camera=stream.name
+            ))
+    
+    def _check_backend_health(self):
+        """Ping process inference mỗi health_interval giây, không trả lời thì restart"""
+        if not isinstance(self.backend, ProcessBackend) or not self.health_interval:
+            return
+        now = time.time()
+        if now - self._last_health_check < self.health_interval:
+            return
+        self._last_health_check = now
+        
+        if not self.backend.healthy():
+            self.logger.warning("Process inference không phản hồi ping!")
+            self.backend.restart()
+    
+    def _worker_loop(self):
+        """Vòng lặp inference của detection worker"""
+        while self._worker_running:
+            try:
+                self._check_backend_health()
+                
+                # Đợi tới lượt theo duty-cycle (timeout để kịp nhận lệnh dừng)
+                if not self.scheduler.wait(timeout=0.5):
+                    continue
+                
+                batch = self._read_batch(wait=True)
+                if not batch:
+                    if all(stream.capture is None for stream in self.streams):
+                        time.sleep(0.1)  # Tránh spin khi camera lỗi
+                    continue
+                
+                # Scene tĩnh -> giữ nguyên trạng thái presence
+                for stream, updated, detection in self._process_frames(batch):
+                    if updated:
+                        frame_timestamp = next(b[2] for b in batch if b[0] is stream)
+                        self._update_presence(stream, detection, frame_timestamp)
+            
+            except Exception as e:
+                self.logger.error(f"Lỗi trong detection worker: {e}")
+                time.sleep(0.5)
+    
     def run_detection_loop(self, callback=None, show_preview=True):
         """
         Chạy detection loop liên tục
@@ -205,6 +904,7 @@ class PersonDetector:
             show_preview: Hiển thị preview window (default: True)
         """
         self.logger.info("Bắt đầu detection loop...")
+        shown = {}  # Timestamp frame đã hiển thị của mỗi camera
         
         try:
             while True:
@@ -214,18 +914,22 @@ class PersonDetector:
                 if detected and callback:
                     callback()
                 
-                # Hiển thị preview
+                # Hiển thị preview (mỗi camera một cửa sổ), chỉ vẽ lại khi có frame mới
                 if show_preview:
-                    frame = self.get_frame_with_visualization()
-                    if frame is not None:
-                        cv2.imshow('Person Detection', frame)
+                    for i, stream in enumerate(self.streams):
+                        if stream.last_result is None or shown.get(i) == stream.last_result[1]:
+                            continue
+                        shown[i] = stream.last_result[1]
+                        frame = self.get_frame_with_visualization(i)
+                        if frame is not None:
+                            cv2.imshow(f"Person Detection - {stream.name}", frame)
                     
                     # Nhấn 'q' để thoát
                     if cv2.waitKey(1) & 0xFF == ord('q'):
                         break
                 else:
                     time.sleep(0.1)
-                    
+        
         except KeyboardInterrupt:
             self.logger.info("Dừng detection loop.")
         finally:
@@ -234,15 +938,44 @@ class PersonDetector:
     
     def __del__(self):
         """Cleanup"""
-        self.stop_camera()
+        if hasattr(self, '_worker_running'):
+            self.stop_camera()
 
 # Test standalone
 if __name__ == "__main__":
-    detector = PersonDetector()
-    detector.start_camera()
+    import argparse
+    import json
     
-    def on_person_detected():
-        print("🚶 Có người trong vùng tương tác!")
+    parser = argparse.ArgumentParser(description="Person detection (camera hoặc replay)")
+    parser.add_argument('--video', type=str, help='Replay file video thay cho camera')
+    parser.add_argument('--images', type=str, help='Replay thư mục ảnh thay cho camera')
+    parser.add_argument('--fps', type=float, default=10.0, help='FPS của thư mục ảnh')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Giữ nhịp real-time thay vì chạy nhanh nhất có thể')
+    args = parser.parse_args()
     
-    detector.run_detection_loop(callback=on_person_detected, show_preview=True)
-
+    if args.video or args.images:
+        # Replay dùng zone của camera trong config
+        config = get_config()
+        config.config['camera']['sources'] = [{
+            'name': 'replay',
+            'video': args.video,
+            'images': args.images,
+            'fps': args.fps,
+            'realtime': args.realtime,
+            'detection_zone': config.get('camera.detection_zone'),
+            'zones': config.get('camera.zones'),
+        }]
+        
+        detector = PersonDetector(config)
+        report = detector.run_replay()
+        detector.stop_camera()
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        detector = PersonDetector()
+        detector.start_camera()
+        
+        def on_person_detected():
+            print("🚶 Có người trong vùng tương tác!")
+        
+        detector.run_detection_loop(callback=on_person_detected, show_preview=True)
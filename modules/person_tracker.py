@@ -0,0 +1,181 @@
+"""
+Person Tracker - Theo dõi người qua các frame (ByteTrack-lite)
+Gán ID cố định cho từng người bằng IoU, nội suy vị trí giữa các lần detect
+"""
+import numpy as np
+from typing import List
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    IoU giữa từng cặp box
+    
+    Args:
+        boxes_a: (A, 4) x1, y1, x2, y2
+        boxes_b: (B, 4) x1, y1, x2, y2
+    
+    Returns:
+        (A, B) IoU
+    """
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-7)
+
+def greedy_match(iou: np.ndarray, threshold: float):
+    """
+    Ghép cặp tham lam theo IoU giảm dần
+    
+    Returns:
+        (list các cặp (row, col), set row chưa ghép, set col chưa ghép)
+    """
+    rows, cols = iou.shape
+    unmatched_rows, unmatched_cols = set(range(rows)), set(range(cols))
+    matches = []
+    
+    if rows and cols:
+        for flat in np.argsort(iou, axis=None)[::-1]:
+            r, c = divmod(int(flat), cols)
+            if iou[r, c] < threshold:
+                break
+            if r in unmatched_rows and c in unmatched_cols:
+                matches.append((r, c))
+                unmatched_rows.discard(r)
+                unmatched_cols.discard(c)
+    
+    return matches, unmatched_rows, unmatched_cols
+
+class Track:
+    """Một người đang được theo dõi"""
+    
+    def __init__(self, track_id: int, box: np.ndarray, score: float, timestamp: float):
+        self.track_id = track_id
+        self.box = box.astype(np.float32)
+        self.measured_box = self.box.copy()  # Box detector thấy lần cuối
+        self.score = score
+        self.velocity = np.zeros(4, dtype=np.float32)  # pixel/giây cho từng toạ độ
+        
+        self.last_seen = timestamp  # Lần cuối được detector xác nhận
+        self.last_update = timestamp  # Lần cuối box được cập nhật/nội suy
+        
+        # Dwell trong zone (do PersonDetector quản lý)
+        self.zone_enter_time = None
+    
+    def predict(self, timestamp: float):
+        """Nội suy vị trí theo vận tốc không đổi"""
+        dt = timestamp - self.last_update
+        if dt > 0:
+            self.box = self.box + self.velocity * dt
+            self.last_update = timestamp
+    
+    def update(self, box: np.ndarray, score: float, timestamp: float):
+        """Cập nhật với detection mới (sau khi đã predict tới timestamp)"""
+        box = box.astype(np.float32)
+        dt = timestamp - self.last_seen
+        if dt > 0:
+            # Làm mượt vận tốc để không giật theo nhiễu của box
+            measured = (box - self.measured_box) / dt
+            self.velocity = 0.5 * self.velocity + 0.5 * measured
+        
+        self.box = box
+        self.measured_box = box.copy()
+        self.score = score
+        self.last_seen = timestamp
+        self.last_update = timestamp
+
+class PersonTracker:
+    """
+    Tracker IoU hai tầng kiểu ByteTrack
+    
+    Detection có confidence cao được ghép trước và có thể tạo track mới;
+    detection confidence thấp chỉ dùng để nối tiếp các track còn lại
+    (người bị che một phần), không tạo track mới.
+    """
+    
+    def __init__(self,
+                 iou_threshold: float = 0.3,
+                 high_threshold: float = 0.5,
+                 low_threshold: float = 0.25,
+                 max_age: float = 1.0):
+        """
+        Args:
+            iou_threshold: IoU tối thiểu để ghép detection với track
+            high_threshold: Confidence để tạo track mới / ghép tầng 1
+            low_threshold: Confidence tối thiểu cho ghép tầng 2
+            max_age: Xoá track không được xác nhận sau số giây này
+        """
+        self.iou_threshold = iou_threshold
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+        self.max_age = max_age
+        
+        self.tracks: List[Track] = []
+        self._next_id = 1
+    
+    def _predict_and_prune(self, timestamp: float):
+        """Nội suy các track tới timestamp, bỏ track đã quá max_age"""
+        self.tracks = [t for t in self.tracks if timestamp - t.last_seen <= self.max_age]
+        for track in self.tracks:
+            track.predict(timestamp)
+    
+    def propagate(self, timestamp: float) -> List[Track]:
+        """Cập nhật vị trí track khi không chạy detector ở frame này"""
+        self._predict_and_prune(timestamp)
+        return self.tracks
+    
+    def update(self, boxes: np.ndarray, scores: np.ndarray, timestamp: float) -> List[Track]:
+        """
+        Cập nhật tracker với detection của một frame
+        
+        Args:
+            boxes: (N, 4) box người
+            scores: (N,) confidence
+            timestamp: Thời điểm capture frame
+        
+        Returns:
+            Danh sách track đang sống
+        """
+        self._predict_and_prune(timestamp)
+        
+        keep = scores >= self.low_threshold
+        boxes, scores = boxes[keep], scores[keep]
+        high = scores >= self.high_threshold
+        high_idx, low_idx = np.flatnonzero(high), np.flatnonzero(~high)
+        
+        track_boxes = np.array([t.box for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        
+        # Tầng 1: detection confidence cao
+        matches, free_tracks, free_high = greedy_match(
+            iou_matrix(track_boxes, boxes[high_idx]), self.iou_threshold
+        )
+        for t, d in matches:
+            det = high_idx[d]
+            self.tracks[t].update(boxes[det], float(scores[det]), timestamp)
+        
+        # Tầng 2: detection confidence thấp cho các track còn lại
+        free_tracks = sorted(free_tracks)
+        matches, _, _ = greedy_match(
+            iou_matrix(track_boxes[free_tracks], boxes[low_idx]), self.iou_threshold
+        )
+        for t, d in matches:
+            det = low_idx[d]
+            self.tracks[free_tracks[t]].update(boxes[det], float(scores[det]), timestamp)
+        
+        # Detection confidence cao chưa ghép -> track mới
+        for d in sorted(free_high):
+            det = high_idx[d]
+            self.tracks.append(Track(self._next_id, boxes[det], float(scores[det]), timestamp))
+            self._next_id += 1
+        
+        return self.tracks
+    
+    def reset(self):
+        """Xoá toàn bộ track"""
+        self.tracks = []
@@ -0,0 +1,372 @@
+"""
+Quantize Detector - Tạo model person detection INT8 (static quantization) cho ONNX Runtime CPU
+Calibrate bằng frame ghi từ chính camera của kiosk, so sánh độ chính xác với fp32
+
+Chạy:
+    python -m modules.quantize_detector --calib recordings/frames/ --eval datasets/kiosk-labelled/
+    python -m modules.quantize_detector --calib-video recordings/kiosk.mp4 --imgsz 320
+    python -m modules.quantize_detector --calib-camera 0 --count 200
+
+Sau đó đặt person_detection.model trỏ tới file .onnx được tạo ra.
+"""
+import argparse
+import json
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+from utils.logger import setup_logger
+from utils.config_loader import get_config
+from utils.video_utils import IMAGE_EXTENSIONS, create_frame_source
+from modules.detector_backends import OnnxBackend, export_onnx, file_hash, preprocess
+from modules.person_tracker import iou_matrix
+
+PERSON_CLASS = 0
+
+def collect_frames(source_config: dict, count: int, interval: float = 0.0,
+                   max_failures: int = 50) -> List[np.ndarray]:
+    """
+    Lấy frame calibration từ camera, file video hoặc thư mục ảnh
+    
+    Args:
+        source_config: {device_id} | {video} | {images} như camera.sources
+        count: Số frame tối đa
+        interval: Khoảng cách giữa 2 frame lấy từ camera (giây), để frame đa dạng
+        max_failures: Số lần đọc lỗi liên tiếp trước khi bỏ cuộc
+    
+    Raises:
+        RuntimeError: Không mở được nguồn, đọc lỗi liên tiếp quá max_failures
+            lần hoặc không lấy được frame nào
+    """
+    source = create_frame_source(source_config)
+    if not source.open():
+        raise RuntimeError(f"Không thể mở {source.label}")
+    
+    frames = []
+    last_time = None
+    failures = 0
+    try:
+        while len(frames) < count and not source.exhausted:
+            ret, frame, timestamp = source.read()
+            if not ret:
+                # Camera lỗi/rút dây thì read() trả False mãi -> không quay vô hạn
+                failures += 1
+                if failures >= max_failures:
+                    raise RuntimeError(f"Đọc frame từ {source.label} lỗi {failures} lần liên tiếp")
+                time.sleep(0.1)
+                continue
+            failures = 0
+            if last_time is not None and timestamp - last_time < interval:
+                continue
+            last_time = timestamp
+            frames.append(frame)
+    finally:
+        source.release()
+    
+    if not frames:
+        raise RuntimeError(f"Không lấy được frame calibration từ {source.label}")
+    return frames
+
+def load_labelled_set(path: str) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Đọc tập ảnh có nhãn theo format YOLO
+    
+    Mỗi ảnh <tên>.jpg đi kèm <tên>.txt (cùng thư mục hoặc thư mục labels/
+    bên cạnh), mỗi dòng: class cx cy w h (chuẩn hoá 0-1). Chỉ giữ class person.
+    
+    Returns:
+        List (ảnh BGR, box người (M, 4) x1, y1, x2, y2 theo pixel)
+    """
+    import cv2
+    
+    root = Path(path)
+    images_dir = root / "images" if (root / "images").is_dir() else root
+    samples = []
+    
+    for image_path in sorted(images_dir.iterdir()):
+        if image_path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = cv2.imread(str(image_path))
+        if image is None:
+            continue
+        
+        label_path = image_path.with_suffix('.txt')
+        if not label_path.exists():
+            label_path = root / "labels" / f"{image_path.stem}.txt"
+        
+        boxes = np.zeros((0, 4), dtype=np.float32)
+        if label_path.exists() and label_path.stat().st_size:
+            rows = np.loadtxt(label_path, dtype=np.float32, ndmin=2).reshape(-1, 5)
+            rows = rows[rows[:, 0] == PERSON_CLASS]
+            height, width = image.shape[:2]
+            cx, cy = rows[:, 1] * width, rows[:, 2] * height
+            w, h = rows[:, 3] * width, rows[:, 4] * height
+            boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        
+        samples.append((image, boxes))
+    
+    if not samples:
+        raise RuntimeError(f"Không có ảnh nào trong {images_dir}")
+    return samples
+
+def prune_classes(onnx_path: Path, output_path: Path, keep: List[int]) -> Path:
+    """
+    Cắt output YOLOv8 (1, 4 + num_classes, anchors) chỉ còn box + các class cần giữ
+    
+    Thêm một node Gather ở cuối graph, tên output giữ nguyên nên
+    OnnxBackend đọc được như model gốc (class id đánh lại từ 0).
+    """
+    import onnx
+    from onnx import helper, numpy_helper
+    
+    model = onnx.load(str(onnx_path))
+    graph = model.graph
+    output = graph.output[0]
+    full_name = f"{output.name}_all_classes"
+    
+    for node in graph.node:
+        for i, name in enumerate(node.output):
+            if name == output.name:
+                node.output[i] = full_name
+    
+    indices = numpy_helper.from_array(
+        np.array([0, 1, 2, 3] + [4 + c for c in keep], dtype=np.int64),
+        name=f"{output.name}_keep"
+    )
+    graph.initializer.append(indices)
+    graph.node.append(helper.make_node(
+        'Gather', [full_name, indices.name], [output.name], name="PruneClasses", axis=1
+    ))
+    output.type.tensor_type.shape.dim[1].dim_value = 4 + len(keep)
+    
+    onnx.save(model, str(output_path))
+    return output_path
+
+def head_nodes(onnx_path: Path, depth: int = 2) -> List[str]:
+    """
+    Tên các node cuối của head (đi ngược từ output depth bước)
+    
+    Các node này ghép box (0-imgsz pixel) với score (0-1) vào cùng một
+    tensor; quantize chung một scale sẽ làm mất gần hết độ phân giải của
+    score, nên giữ chúng ở fp32.
+    """
+    import onnx
+    
+    graph = onnx.load(str(onnx_path)).graph
+    producers = {name: node for node in graph.node for name in node.output}
+    
+    names, frontier = [], [graph.output[0].name]
+    for _ in range(depth + 1):
+        next_frontier = []
+        for tensor in frontier:
+            node = producers.get(tensor)
+            if node is not None and node.name not in names:
+                names.append(node.name)
+                next_frontier.extend(node.input)
+        frontier = next_frontier
+    return names
+
+class FrameCalibrationReader:
+    """CalibrationDataReader cho ONNX Runtime: preprocess giống hệt OnnxBackend"""
+    
+    def __init__(self, frames: List[np.ndarray], imgsz: int, input_name: str):
+        self.frames = frames
+        self.imgsz = imgsz
+        self.input_name = input_name
+        self._index = 0
+    
+    def get_next(self) -> Optional[dict]:
+        if self._index >= len(self.frames):
+            return None
+        blob, _, _ = preprocess(self.frames[self._index], self.imgsz)
+        self._index += 1
+        return {self.input_name: blob[None]}
+    
+    def rewind(self):
+        self._index = 0
+
+def quantize_model(fp32_path: Path, output_path: Path, frames: List[np.ndarray],
+                   imgsz: int, per_channel: bool = True, logger=None) -> Path:
+    """
+    Static quantization INT8 (QDQ, weight int8 per-channel, activation uint8)
+    
+    Range activation được calibrate (MinMax) trên frame thật của kiosk.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+    )
+    
+    logger = logger or setup_logger("Quantize")
+    
+    # Chuẩn hoá graph (shape inference, fold constant) trước khi quantize nếu có sẵn
+    prepared_path = fp32_path.with_name(f"{fp32_path.stem}-prep.onnx")
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(str(fp32_path), str(prepared_path))
+    except Exception as e:
+        logger.warning(f"Bỏ qua pre-process ({e}), quantize trực tiếp model fp32")
+        prepared_path = fp32_path
+    
+    input_name = ort.InferenceSession(
+        str(prepared_path), providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+    
+    class Reader(FrameCalibrationReader, CalibrationDataReader):
+        pass
+    
+    excluded = head_nodes(prepared_path)
+    logger.info(f"Đang calibrate + quantize trên {len(frames)} frame "
+                f"(giữ fp32: {', '.join(excluded)})...")
+    start = time.time()
+    quantize_static(
+        str(prepared_path),
+        str(output_path),
+        Reader(frames, imgsz, input_name),
+        quant_format=QuantFormat.QDQ,
+        per_channel=per_channel,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded
+    )
+    logger.info(f"Đã quantize trong {time.time() - start:.1f}s: {output_path}")
+    
+    if prepared_path != fp32_path:
+        prepared_path.unlink()
+    return output_path
+
+def evaluate(backend: OnnxBackend, samples: List[Tuple[np.ndarray, np.ndarray]],
+             conf_threshold: float, iou_threshold: float = 0.5) -> dict:
+    """
+    Đánh giá detection người trên tập có nhãn
+    
+    Returns:
+        Dict: ap50, precision/recall tại conf_threshold, latency trung bình (ms)
+    """
+    records = []  # (score, là true positive)
+    num_gt = 0
+    latencies = []
+    
+    for image, gt_boxes in samples:
+        start = time.perf_counter()
+        detections = backend.predict(image)
+        latencies.append(time.perf_counter() - start)
+        
+        detections = detections[detections[:, 5] == PERSON_CLASS]
+        detections = detections[np.argsort(-detections[:, 4])]
+        num_gt += len(gt_boxes)
+        
+        ious = iou_matrix(detections[:, :4], gt_boxes)
+        matched = np.zeros(len(gt_boxes), dtype=bool)
+        for i in range(len(detections)):
+            tp = False
+            if len(gt_boxes):
+                candidates = np.where(matched, -1.0, ious[i])
+                best = int(np.argmax(candidates))
+                if candidates[best] >= iou_threshold:
+                    matched[best] = True
+                    tp = True
+            records.append((float(detections[i, 4]), tp))
+    
+    records.sort(key=lambda r: -r[0])
+    scores = np.array([r[0] for r in records], dtype=np.float32)
+    tps = np.array([r[1] for r in records], dtype=bool)
+    cum_tp = np.cumsum(tps)
+    cum_fp = np.cumsum(~tps)
+    recall = cum_tp / max(num_gt, 1)
+    precision = cum_tp / np.maximum(cum_tp + cum_fp, 1)
+    
+    # AP: diện tích dưới đường precision-recall (nội suy mọi điểm)
+    envelope = np.maximum.accumulate(np.concatenate([precision, [0.0]])[::-1])[::-1]
+    recall_steps = np.diff(np.concatenate([[0.0], recall]))
+    ap50 = float(np.sum(recall_steps * envelope[:-1])) if len(records) else 0.0
+    
+    above = scores >= conf_threshold
+    tp_at = int(np.count_nonzero(tps & above))
+    return {
+        'images': len(samples),
+        'persons': num_gt,
+        'ap50': round(ap50, 4),
+        'precision': round(tp_at / max(int(np.count_nonzero(above)), 1), 4),
+        'recall': round(tp_at / max(num_gt, 1), 4),
+        'latency_ms': round(1000 * float(np.mean(latencies)), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize person detector sang INT8")
+    parser.add_argument('--model', type=str, help='Model .pt (mặc định: person_detection.model)')
+    parser.add_argument('--imgsz', type=int, help='Kích thước input (mặc định: person_detection.roi.imgsz)')
+    parser.add_argument('--calib', type=str, help='Thư mục ảnh calibration')
+    parser.add_argument('--calib-video', type=str, help='Video calibration')
+    parser.add_argument('--calib-camera', type=int, help='Lấy frame calibration trực tiếp từ camera')
+    parser.add_argument('--count', type=int, default=200, help='Số frame calibration tối đa')
+    parser.add_argument('--eval', type=str, help='Tập ảnh có nhãn YOLO để so sánh với fp32')
+    parser.add_argument('--all-classes', action='store_true', help='Không cắt bớt class (mặc định chỉ giữ person)')
+    parser.add_argument('--output', type=str, help='File .onnx INT8 (mặc định: models/<model>-<hash>-<imgsz>-int8.onnx)')
+    args = parser.parse_args()
+    
+    logger = setup_logger("Quantize")
+    config = get_config()
+    model_path = args.model or config.get('person_detection.model', 'yolov8n.pt')
+    imgsz = args.imgsz or config.get('person_detection.roi.imgsz', 320)
+    cache_dir = Path(config.get('person_detection.onnx.cache_dir', 'models'))
+    
+    if args.calib:
+        source = {'images': args.calib}
+    elif args.calib_video:
+        source = {'video': args.calib_video}
+    elif args.calib_camera is not None:
+        source = {'device_id': args.calib_camera}
+    else:
+        parser.error("Cần --calib, --calib-video hoặc --calib-camera")
+    
+    frames = collect_frames(source, args.count, interval=0.5 if 'device_id' in source else 0.0)
+    logger.info(f"Đã lấy {len(frames)} frame calibration")
+    
+    # fp32 ONNX (cache theo hash model + imgsz), rồi cắt class
+    fp32_path = export_onnx(model_path, imgsz, cache_dir, logger)
+    source_path = fp32_path
+    suffix = "int8" if args.all_classes else "person-int8"
+    if not args.all_classes:
+        source_path = prune_classes(fp32_path, fp32_path.with_name(f"{fp32_path.stem}-person.onnx"),
+                                    keep=[PERSON_CLASS])
+    
+    output_path = Path(args.output or fp32_path.with_name(f"{fp32_path.stem}-{suffix}.onnx"))
+    quantize_model(source_path, output_path, frames, imgsz, logger=logger)
+    
+    report = {
+        'model': model_path,
+        'model_hash': file_hash(str(model_path)),  # Model nguồn (.pt), cùng hash với tên file cache ONNX
+        'imgsz': imgsz,
+        'calibration_frames': len(frames),
+        'fp32': {'path': str(source_path), 'size_mb': round(source_path.stat().st_size / 1e6, 2)},
+        'int8': {'path': str(output_path), 'size_mb': round(output_path.stat().st_size / 1e6, 2)},
+    }
+    
+    if args.eval:
+        samples = load_labelled_set(args.eval)
+        conf_threshold = config.get('person_detection.confidence_threshold', 0.5)
+        num_threads = config.get('person_detection.onnx.num_threads')
+        # So với fp32 cùng số class để delta chỉ phản ánh sai số quantization
+        for key, path in (('fp32', source_path), ('int8', output_path)):
+            # conf thấp để tính được cả đường precision-recall
+            backend = OnnxBackend(str(path), imgsz=imgsz, conf_threshold=0.01,
+                                  num_threads=num_threads)
+            report[key].update(evaluate(backend, samples, conf_threshold))
+        
+        report['delta'] = {
+            metric: round(report['int8'][metric] - report['fp32'][metric], 4)
+            for metric in ('ap50', 'precision', 'recall', 'latency_ms')
+        }
+        logger.info(f"AP50 fp32 {report['fp32']['ap50']:.3f} -> int8 {report['int8']['ap50']:.3f} "
+                    f"(Δ {report['delta']['ap50']:+.3f}), latency "
+                    f"{report['fp32']['latency_ms']:.1f}ms -> {report['int8']['latency_ms']:.1f}ms")
+    
+    report_path = output_path.with_suffix('.json')
+    report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    logger.info(f"Đặt person_detection.model: \"{output_path}\" để dùng model INT8")
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,13 @@ Speech-to-Text Engine - Chuyển giọng nói thành văn bản
 Sử dụng Vosk (offline, nhanh) cho độ trễ thấp
 """
 import json
+import time
 import wave
-from vosk import Model, KaldiRecognizer
 from utils.logger import setup_logger
 from utils.config_loader import get_config
-from utils.audio_utils import AudioRecorder
-from typing import Optional
+from utils.audio_utils import AudioRecorder, get_microphone
+from modules.vosk_models import RecognizerPool, get_model_registry
+from typing import Iterator, Optional, Tuple
 
 class STTEngine:
     """Speech-to-Text với độ trễ thấp"""
@@ -24,23 +25,35 @@ class STTEngine:
         # Load cấu hình
         self.sample_rate = self.config.get('stt.sample_rate', 16000)
         self.silence_duration = self.config.get('stt.silence_duration', 1.5)
+        self.streaming = self.config.get('stt.streaming', True)
         
-        # Load Vosk model
+        # Vosk model (dùng chung với wake word qua registry)
         model_path = self.config.get('stt.model_path', 'models/vosk-model-small-vi-0.4')
-        self.logger.info(f"Đang load Vosk model từ {model_path}...")
         
         try:
-            self.model = Model(model_path)
-            self.logger.info("Vosk model đã được load thành công!")
+            self.model = get_model_registry().acquire(model_path)
         except Exception as e:
             self.logger.error(f"Không thể load Vosk model: {e}")
             self.logger.error("Hãy tải model tại: https://alphacephei.com/vosk/models")
             raise
         
-        # Audio recorder
+        # Recognizer dùng lại giữa các câu, luôn có sẵn một instance trước khi LISTENING
+        self.recognizers = RecognizerPool(
+            self.model,
+            self.sample_rate,
+            size=self.config.get('stt.recognizer_pool', 2)
+        )
+        self.recognizers.prewarm(1)
+        
+        # Audio recorder (đọc từ microphone dùng chung với wake word)
         self.recorder = AudioRecorder(
             sample_rate=self.sample_rate,
-            silence_duration=self.silence_duration
+            chunk_size=self.config.get('audio.chunk_size', 1024),
+            silence_duration=self.silence_duration,
+            capture=get_microphone(self.config),
+            pre_roll=self.config.get('stt.pre_roll', 1.0),
+            vad_options=self.config.get('stt.vad'),
+            echo_cancellation=self.config.get('audio.echo_cancellation', False)
         )
     
     def transcribe_audio_data(self, audio_data: bytes) -> str:
@@ -53,36 +66,44 @@ class STTEngine:
         Returns:
             Văn bản nhận dạng được
         """
-        recognizer = KaldiRecognizer(self.model, self.sample_rate)
-        recognizer.SetWords(True)
-        
-        # Process audio
-        if recognizer.AcceptWaveform(audio_data):
-            result = json.loads(recognizer.Result())
-        else:
-            result = json.loads(recognizer.FinalResult())
+        with self.recognizers.recognizer() as recognizer:
+            # Process audio
+            if recognizer.AcceptWaveform(audio_data):
+                result = json.loads(recognizer.Result())
+            else:
+                result = json.loads(recognizer.FinalResult())
         
         text = result.get('text', '')
         return text.strip()
     
-    def transcribe_from_mic(self, mic_index: Optional[int] = None) -> str:
+    def transcribe_from_mic(self, mic_index: Optional[int] = None,
+                            start: Optional[int] = None) -> str:
         """
         Ghi âm từ mic và chuyển thành văn bản
         
         Args:
             mic_index: Index của microphone (None = default)
+            start: Vị trí audio bắt đầu (vd: WakeWordDetector.detection_position),
+                None = kèm pre-roll stt.pre_roll giây
         
         Returns:
             Văn bản nhận dạng được
         """
         self.logger.info("🎤 Đang ghi âm...")
         
-        # Ghi âm
-        audio_data = self.recorder.record(device_index=mic_index)
-        
-        # Transcribe
-        self.logger.info("📝 Đang nhận dạng giọng nói...")
-        text = self.transcribe_audio_data(audio_data)
+        if self.streaming:
+            # Decode trong lúc ghi, kết quả cuối có ngay sau end-of-speech
+            text = ""
+            for text, final in self.stream_transcribe(mic_index, start):
+                if not final:
+                    self.logger.debug(f"… {text}")
+        else:
+            # Ghi âm
+            audio_data = self.recorder.record(device_index=mic_index, start=start)
+            
+            # Transcribe
+            self.logger.info("📝 Đang nhận dạng giọng nói...")
+            text = self.transcribe_audio_data(audio_data)
         
         if text:
             self.logger.info(f"✅ Nhận dạng: '{text}'")
@@ -91,6 +112,44 @@ class STTEngine:
         
         return text
     
+    def stream_transcribe(self, mic_index: Optional[int] = None,
+                          start: Optional[int] = None) -> Iterator[Tuple[str, bool]]:
+        """
+        Ghi âm và nhận dạng song song: mỗi chunk được đưa vào recognizer ngay
+        khi thu được
+        
+        Args:
+            mic_index: Index của microphone (None = default)
+            start: Vị trí audio bắt đầu (như transcribe_from_mic)
+        
+        Yields:
+            (text, final): text là partial hypothesis mỗi khi thay đổi,
+            phần tử cuối cùng có final=True là kết quả sau end-of-speech
+        """
+        with self.recognizers.recognizer() as recognizer:
+            segments = []  # Các đoạn Vosk đã chốt (câu dài có thể có nhiều đoạn)
+            last = ""
+            for samples in self.recorder.stream(device_index=mic_index, start=start):
+                if recognizer.AcceptWaveform(samples.tobytes()):
+                    text = json.loads(recognizer.Result()).get('text', '')
+                    if text:
+                        segments.append(text)
+                    partial = ""
+                else:
+                    partial = json.loads(recognizer.PartialResult()).get('partial', '')
+                
+                current = " ".join(segments + [partial]).strip()
+                if current != last:
+                    last = current
+                    yield current, False
+            
+            # Audio đã được decode hết trong lúc ghi, chỉ còn chốt đoạn cuối
+            endpoint_time = time.time()
+            final = json.loads(recognizer.FinalResult()).get('text', '')
+            text = " ".join(segments + [final]).strip()
+            self.logger.debug(f"Kết quả cuối sau end-of-speech {(time.time() - endpoint_time) * 1000:.0f}ms")
+            yield text, True
+    
     def transcribe_from_file(self, wav_file: str) -> str:
         """
         Nhận dạng giọng nói từ file WAV
@@ -127,6 +186,18 @@ class STTEngine:
         Alias cho transcribe_from_mic() - tên rõ nghĩa hơn
         """
         return self.transcribe_from_mic(mic_index)
+    
+    def get_stats(self) -> dict:
+        """Thống kê pool recognizer (hit/miss, chi phí Reset)"""
+        return self.recognizers.get_stats()
+    
+    def close(self):
+        """Tách khỏi microphone dùng chung và trả Vosk model cho registry"""
+        self.recorder.close()
+        self.recognizers.close()
+        if self.model is not None:
+            get_model_registry().release(self.model)
+            self.model = None
 
 # Test standalone
 if __name__ == "__main__":
@@ -145,7 +216,7 @@ if __name__ == "__main__":
         print("\n" + "=" * 50)
         print(f"📝 Kết quả: {text if text else '(không nhận dạng được)'}")
         print("=" * 50)
-        
+    
     except KeyboardInterrupt:
         print("\nThoát chương trình.")
     except Exception as e:
@@ -6,6 +6,7 @@ import pyttsx3
 from typing import Optional
 from utils.logger import setup_logger
 from utils.config_loader import get_config
+from utils.audio_utils import get_microphone
 
 class TTSEngine:
     """Text-to-Speech với độ trễ thấp"""
@@ -17,6 +18,7 @@ class TTSEngine:
         """
         self.config = config or get_config()
         self.logger = setup_logger("TTS")
+        self.microphone = get_microphone(self.config)  # Báo cho mic lúc loa đang phát
         
         # Khởi tạo pyttsx3
         self.engine = pyttsx3.init()
@@ -74,7 +76,11 @@ class TTSEngine:
             self.engine.say(text)
             
             if block:
-                self.engine.runAndWait()
+                self.microphone.begin_playback()
+                try:
+                    self.engine.runAndWait()
+                finally:
+                    self.microphone.end_playback()
             
         except Exception as e:
             self.logger.error(f"Lỗi khi đọc văn bản: {e}")
@@ -0,0 +1,231 @@
+"""
+Vosk Model Registry - Dùng chung một vosk.Model cho cả process
+Wake word và STT cùng trỏ tới stt.model_path, model chỉ được load một lần
+"""
+import os
+import queue
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from vosk import KaldiRecognizer, Model
+from utils.logger import setup_logger
+
+def current_rss_mb() -> float:
+    """RSS hiện tại của process (MB); không có /proc thì dùng peak RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class VoskModelRegistry:
+    """
+    Registry vosk.Model theo (đường dẫn, tham số), có đếm tham chiếu
+    
+    acquire() trả về cùng một instance cho cùng key; release() giảm đếm và
+    bỏ model khi người dùng cuối cùng trả lại.
+    """
+    
+    def __init__(self):
+        self.logger = setup_logger("VoskModels")
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> {'model', 'refs', 'load_time', 'rss_mb'}
+    
+    @staticmethod
+    def _key(model_path: str, options: dict) -> tuple:
+        return os.path.realpath(model_path), tuple(sorted(options.items()))
+    
+    def acquire(self, model_path: str, **options) -> Model:
+        """
+        Lấy model (load nếu chưa có)
+        
+        Args:
+            model_path: Thư mục model Vosk
+            **options: Tham số khác cho vosk.Model
+        """
+        key = self._key(model_path, options)
+        with self._lock:  # Giữ lock khi load: người thứ hai chờ thay vì load lần nữa
+            entry = self._entries.get(key)
+            if entry is None:
+                self.logger.info(f"Đang load Vosk model từ {model_path}...")
+                rss_before = current_rss_mb()
+                start = time.time()
+                model = Model(model_path, **options)
+                entry = {
+                    'model': model,
+                    'refs': 0,
+                    'load_time': time.time() - start,
+                    'rss_mb': current_rss_mb() - rss_before,
+                }
+                self._entries[key] = entry
+                self.logger.info(f"Vosk model đã được load: {entry['load_time']:.2f}s, "
+                                 f"RSS +{entry['rss_mb']:.0f}MB")
+            else:
+                self.logger.info(f"Dùng lại Vosk model đã load: {model_path}")
+            
+            entry['refs'] += 1
+            return entry['model']
+    
+    def release(self, model: Model):
+        """Trả model; model bị bỏ khi không còn ai dùng"""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry['model'] is model:
+                    entry['refs'] -= 1
+                    if entry['refs'] <= 0:
+                        del self._entries[key]
+                        self.logger.info(f"Đã giải phóng Vosk model: {key[0]}")
+                    return
+    
+    def get_stats(self) -> dict:
+        """Các model đang load: số người dùng, thời gian load, RSS tăng thêm"""
+        with self._lock:
+            return {
+                key[0]: {
+                    'refs': entry['refs'],
+                    'load_time': round(entry['load_time'], 2),
+                    'rss_mb': round(entry['rss_mb'], 1),
+                }
+                for key, entry in self._entries.items()
+            }
+
+class RecognizerPool:
+    """
+    Pool KaldiRecognizer dùng lại giữa các lần nhận dạng
+    
+    Tạo recognizer (cấp phát + dựng decoder graph) tốn thời gian ngay trên
+    đường latency người dùng cảm nhận. Pool giữ sẵn các instance đã Reset();
+    instance trả về được Reset trên thread nền rồi mới vào pool, nên cả
+    acquire lẫn release đều không chờ Reset. Nhiều job cùng lúc (batch, file)
+    lấy instance riêng; thiếu thì tạo thêm (miss).
+    """
+    
+    def __init__(self, model: Model, sample_rate: int, size: int = 2, words: bool = True):
+        """
+        Args:
+            model: vosk.Model dùng chung
+            sample_rate: Tần số mẫu audio
+            size: Số recognizer rảnh tối đa giữ lại
+            words: Bật SetWords (thời gian từng từ trong kết quả)
+        """
+        self.logger = setup_logger("RecognizerPool")
+        self.model = model
+        self.sample_rate = sample_rate
+        self.size = size
+        self.words = words
+        
+        self._lock = threading.Lock()
+        self._idle = []
+        self.in_use = 0
+        self._dirty = queue.Queue()
+        self._resetter = None
+        
+        # Thống kê
+        self.hits = 0
+        self.misses = 0
+        self.resets = 0
+        self.reset_time = 0.0
+        self.created = 0
+        self.create_time = 0.0
+    
+    def _create(self) -> KaldiRecognizer:
+        start = time.time()
+        recognizer = KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.SetWords(self.words)
+        self.created += 1
+        self.create_time += time.time() - start
+        return recognizer
+    
+    def prewarm(self, count: int = 1):
+        """Tạo trước recognizer để có ít nhất count instance rảnh"""
+        while True:
+            with self._lock:
+                if len(self._idle) >= min(count, self.size):
+                    return
+            recognizer = self._create()
+            with self._lock:
+                self._idle.append(recognizer)
+    
+    def acquire(self) -> KaldiRecognizer:
+        """Lấy recognizer sạch (từ pool hoặc tạo mới)"""
+        with self._lock:
+            self.in_use += 1
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            self.misses += 1
+        return self._create()
+    
+    def release(self, recognizer: KaldiRecognizer):
+        """Trả recognizer; Reset diễn ra trên thread nền (bỏ đi nếu pool đã đủ)"""
+        with self._lock:
+            self.in_use -= 1
+            if self.model is None:
+                return
+            if self._resetter is None:
+                self._resetter = threading.Thread(target=self._reset_loop, daemon=True)
+                self._resetter.start()
+        self._dirty.put(recognizer)
+    
+    def _reset_loop(self):
+        """Reset các recognizer vừa trả về rồi đưa vào pool"""
+        while True:
+            recognizer = self._dirty.get()
+            if recognizer is None:
+                break
+            
+            start = time.time()
+            recognizer.Reset()
+            elapsed = time.time() - start
+            
+            with self._lock:
+                self.resets += 1
+                self.reset_time += elapsed
+                if self.model is not None and len(self._idle) < self.size:
+                    self._idle.append(recognizer)
+    
+    def close(self):
+        """Bỏ các recognizer rảnh và tham chiếu tới model (để registry giải phóng được)"""
+        with self._lock:
+            self._idle.clear()
+            self.model = None
+            resetter, self._resetter = self._resetter, None
+        if resetter is not None:
+            self._dirty.put(None)
+            resetter.join(timeout=1.0)
+    
+    @contextmanager
+    def recognizer(self):
+        """with pool.recognizer() as recognizer: ... (tự trả về pool)"""
+        recognizer = self.acquire()
+        try:
+            yield recognizer
+        finally:
+            self.release(recognizer)
+    
+    def get_stats(self) -> dict:
+        """Hit/miss, số instance rảnh/đang dùng, chi phí Reset trung bình"""
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'hits': self.hits,
+                'misses': self.misses,
+                'reset_ms': round(self.reset_time / max(self.resets, 1) * 1000, 2),
+                'created': self.created,
+                'create_ms': round(self.create_time / max(self.created, 1) * 1000, 2),
+            }
+
+# Registry dùng chung cho cả process
+_registry_instance = None
+_registry_lock = threading.Lock()
+
+def get_model_registry() -> VoskModelRegistry:
+    """Lấy VoskModelRegistry (singleton)"""
+    global _registry_instance
+    with _registry_lock:
+        if _registry_instance is None:
+            _registry_instance = VoskModelRegistry()
+        return _registry_instance
@@ -2,13 +2,168 @@
 Wake Word Detection - Phát hiện từ khóa "Hi UETBot"
 Sử dụng Vosk cho nhận dạng giọng nói liên tục
 """
-import pyaudio
 import json
 import time
-from vosk import Model, KaldiRecognizer
+import unicodedata
+from collections import deque
+from pathlib import Path
+from vosk import KaldiRecognizer
 from utils.logger import setup_logger
 from utils.config_loader import get_config
-from typing import Optional, Callable
+from utils.audio_utils import EnergyGate, get_microphone
+from modules.vosk_models import get_model_registry
+from typing import Callable, List, Optional, Set, Tuple
+
+UNKNOWN_WORD = "[unk]"
+
+# Quy tắc "phát âm" áp lên chuỗi đã bỏ dấu + bỏ khoảng trắng: các cách viết
+# Việt/Anh của cùng một âm (vd: "hai u et bot" ~ "hi uetbot")
+PHONETIC_RULES = [
+    ("ph", "f"), ("ck", "k"), ("c", "k"), ("q", "k"),
+    ("ai", "i"), ("ay", "i"), ("ee", "i"), ("y", "i"),
+    ("oo", "u"), ("w", "u"),
+]
+
+VOWELS = set("aeiouy")
+
+# Thay một nguyên âm trên khoá phát âm chỉ tính nửa lỗi: với keyword 8-9 ký
+# tự, một lỗi nguyên âm vẫn qua ngưỡng 0.9, một lỗi phụ âm thì không
+PHONETIC_VOWEL_COST = 0.5
+
+def normalize_text(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt (kể cả đ), chỉ giữ chữ/số và một khoảng trắng"""
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+def tokenize(text: str) -> List[str]:
+    """Tách hypothesis thành từ đã chuẩn hoá (giữ nguyên [unk])"""
+    return [word if word == UNKNOWN_WORD else normalize_text(word).replace(" ", "")
+            for word in text.split()]
+
+def phonetic_key(compact: str) -> str:
+    """Khoá phát âm thô của chuỗi đã chuẩn hoá (không khoảng trắng)"""
+    for pattern, replacement in PHONETIC_RULES:
+        compact = compact.replace(pattern, replacement)
+    # Gộp ký tự lặp liên tiếp ("uett" -> "uet")
+    return "".join(ch for i, ch in enumerate(compact) if i == 0 or ch != compact[i - 1])
+
+def edit_similarity(a: str, b: str, vowel_cost: float = 1.0) -> float:
+    """
+    1 - khoảng cách Levenshtein / độ dài chuỗi dài hơn
+    
+    Args:
+        vowel_cost: Chi phí thay nguyên âm bằng nguyên âm khác (recognizer hay
+            nhầm nguyên âm, "uet" ~ "oet"); thay phụ âm luôn tốn 1 ("tet" != "uet")
+    """
+    if not a or not b:
+        return 0.0
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            if ca == cb:
+                cost = 0.0
+            elif ca in VOWELS and cb in VOWELS:
+                cost = vowel_cost
+            else:
+                cost = 1.0
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost))
+        previous = current
+    return 1.0 - previous[-1] / max(len(a), len(b))
+
+class KeywordMatcher:
+    """
+    So khớp mờ keyword trong hypothesis của recognizer
+    
+    Các cách nói (keyword + alias) được chuẩn hoá sẵn: bỏ dấu, bỏ khoảng
+    trắng ("hi u e t bot" == "hi uetbot") và khoá phát âm. Mỗi cửa sổ từ liên
+    tiếp trong hypothesis được chấm bằng edit similarity trên cả hai dạng.
+    """
+    
+    def __init__(self, phrases: List[str], threshold: float = 0.9):
+        """
+        Args:
+            phrases: Keyword và các alias
+            threshold: Điểm tối thiểu (0-1) để coi là khớp
+        """
+        self.threshold = threshold
+        self.variants = {}  # Dạng compact -> khoá phát âm
+        for phrase in phrases:
+            compact = normalize_text(phrase).replace(" ", "")
+            if compact:
+                self.variants[compact] = phonetic_key(compact)
+        # Cửa sổ dài nhất cần xét (mỗi từ ít nhất một ký tự)
+        self.max_tokens = max((len(compact) for compact in self.variants), default=1)
+    
+    def _score(self, compact: str) -> float:
+        key = phonetic_key(compact)
+        best = 0.0
+        for variant, variant_key in self.variants.items():
+            if abs(len(compact) - len(variant)) > len(variant) // 2:
+                continue
+            best = max(best, edit_similarity(compact, variant),
+                       edit_similarity(key, variant_key, PHONETIC_VOWEL_COST))
+        return best
+    
+    def match(self, tokens: List[str], first: int = 0) -> Optional[Tuple[int, int, float]]:
+        """
+        Tìm cửa sổ từ khớp keyword tốt nhất
+        
+        Args:
+            tokens: Các từ đã chuẩn hoá của hypothesis
+            first: Chỉ xét cửa sổ kết thúc sau vị trí này (quét tăng dần)
+        
+        Returns:
+            (start, end, score) với tokens[start:end] là keyword, hoặc None
+        """
+        best = None
+        for end in range(max(first, 0) + 1, len(tokens) + 1):
+            for start in range(end - 1, max(end - self.max_tokens, 0) - 1, -1):
+                if tokens[start] == UNKNOWN_WORD:
+                    break
+                compact = "".join(tokens[start:end])
+                if len(compact) > 2 * max(len(variant) for variant in self.variants):
+                    break
+                score = self._score(compact)
+                if score >= self.threshold and (best is None or score > best[2]):
+                    best = (start, end, score)
+            if best is not None:
+                return best  # Kết thúc sớm nhất -> phát hiện sớm nhất
+        return None
+
+def load_vocabulary(model_path: str) -> Optional[Set[str]]:
+    """
+    Từ vựng của model Vosk (graph/words.txt)
+    
+    Returns:
+        Tập các từ, hoặc None nếu model không kèm words.txt
+    """
+    for candidate in ("graph/words.txt", "words.txt"):
+        path = Path(model_path) / candidate
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                return {line.split()[0] for line in f if line.strip()}
+    return None
+
+def build_grammar(phrases: List[str], vocabulary: Optional[Set[str]]) -> Tuple[List[str], List[str]]:
+    """
+    Grammar cho recognizer wake word: các cách nói keyword + [unk]
+    
+    Args:
+        phrases: Keyword và các alias (chữ thường)
+        vocabulary: Từ vựng của model (None = không lọc)
+    
+    Returns:
+        (grammar, bị loại) - phrase có từ ngoài từ vựng không dùng được trong grammar
+    """
+    grammar, dropped = [], []
+    for phrase in dict.fromkeys(phrases):  # Bỏ trùng, giữ thứ tự
+        if vocabulary is not None and not all(word in vocabulary for word in phrase.split()):
+            dropped.append(phrase)
+        else:
+            grammar.append(phrase)
+    return grammar + [UNKNOWN_WORD], dropped
 
 class WakeWordDetector:
     """Phát hiện wake word để đánh thức bot"""
@@ -23,28 +178,180 @@ class WakeWordDetector:
         
         # Load cấu hình
         self.keyword = self.config.get('wake_word.keyword', 'hi uetbot').lower()
+        self.aliases = [alias.lower() for alias in self.config.get('wake_word.aliases') or []]
+        self.phrases = [self.keyword] + self.aliases  # Các cách nói được chấp nhận
         self.sample_rate = self.config.get('audio.sample_rate', 16000)
         self.chunk_size = self.config.get('audio.chunk_size', 1024)
         
-        # Load Vosk model
+        # Vosk model (dùng chung với STT qua registry)
         model_path = self.config.get('stt.model_path', 'models/vosk-model-small-vi-0.4')
-        self.logger.info(f"Đang load Vosk model từ {model_path}...")
+        self.model = None
         
         try:
-            self.model = Model(model_path)
-            self.recognizer = KaldiRecognizer(self.model, self.sample_rate)
+            self.model = get_model_registry().acquire(model_path)
+            self.recognizer = self._create_recognizer(model_path)
             self.recognizer.SetWords(True)
         except Exception as e:
             self.logger.error(f"Không thể load Vosk model: {e}")
             raise
         
-        # Audio
-        self.audio = pyaudio.PyAudio()
-        self.stream = None
+        # Audio: đọc từ microphone dùng chung (không mở stream riêng)
+        self.reader = None
         self.is_listening = False
+        # Bị bỏ lại quá lâu (vd: đang hội thoại) -> bỏ audio cũ thay vì decode bù
+        self.max_lag = int(self.config.get('wake_word.max_lag', 1.0) * self.sample_rate)
+        
+        # Lần phát hiện gần nhất: câu nói tiếp sau keyword và vị trí audio
+        self.trailing_text = ""
+        self.detection_position = None
+        self._origin = 0  # Vị trí audio ứng với thời điểm 0 của recognizer
+        
+        # Cổng năng lượng: chỉ decode khi có âm thanh giống giọng nói
+        self.gate = None
+        if self.config.get('wake_word.energy_gate.enable', True):
+            self.gate = EnergyGate(
+                sample_rate=self.sample_rate,
+                rms_threshold=self.config.get('wake_word.energy_gate.rms_threshold', 300),
+                zcr_min=self.config.get('wake_word.energy_gate.zcr_min', 0.01),
+                zcr_max=self.config.get('wake_word.energy_gate.zcr_max', 0.35)
+            )
+        self.lookback = int(self.config.get('wake_word.energy_gate.lookback', 0.3) * self.sample_rate)
+        self.hold = int(self.config.get('wake_word.energy_gate.hold', 1.0) * self.sample_rate)
+        self._decoding = self.gate is None
+        self._last_voice = 0
+        self._seen_until = 0  # Vị trí xa nhất đã xét (decode hoặc bỏ qua)
+        self.samples_seen = 0
+        self.samples_decoded = 0
+        
+        # So khớp mờ trên partial hypothesis (phát hiện trước khi Vosk chốt câu)
+        self.matcher = KeywordMatcher(self.phrases, self.config.get('wake_word.match_threshold', 0.9))
+        self.use_partial = self.config.get('wake_word.partial', True)
+        if self.use_partial:
+            self.recognizer.SetPartialWords(True)
+        self._partial_tokens = []
+        self.detections = {'partial': 0, 'final': 0}
+        self.latencies = deque(maxlen=100)  # Giây từ lúc nói xong keyword tới lúc phát hiện
         
         self.logger.info(f"WakeWordDetector đã sẵn sàng! Keyword: '{self.keyword}'")
     
+    def _create_recognizer(self, model_path: str) -> KaldiRecognizer:
+        """
+        Recognizer wake word: grammar chỉ gồm keyword/alias + [unk] (nếu bật),
+        decoder chỉ tìm trong vài câu thay vì toàn bộ từ vựng tiếng Việt
+        """
+        if not self.config.get('wake_word.grammar', True):
+            return KaldiRecognizer(self.model, self.sample_rate)
+        
+        grammar, dropped = build_grammar(self.phrases, load_vocabulary(model_path))
+        for phrase in dropped:
+            self.logger.warning(f"Bỏ '{phrase}' khỏi grammar: có từ ngoài từ vựng của model")
+        if len(grammar) == 1:
+            self.logger.warning("Không có cách nói nào của keyword nằm trong từ vựng, "
+                                "dùng recognizer đầy đủ")
+            return KaldiRecognizer(self.model, self.sample_rate)
+        
+        self.logger.info(f"Wake word grammar: {grammar}")
+        return KaldiRecognizer(self.model, self.sample_rate, json.dumps(grammar, ensure_ascii=False))
+    
+    def _resync(self, position: Optional[int] = None):
+        """
+        Reset recognizer và decode tiếp từ position (mặc định: mẫu mới nhất)
+        
+        Thời điểm 0 của recognizer ứng với vị trí mới, nên thời gian từng từ
+        vẫn map đúng về audio dù các đoạn im lặng không được decode.
+        """
+        if position is None:
+            self.reader.seek_latest()
+        else:
+            self.reader.seek(position)
+        self.recognizer.Reset()
+        self._origin = self.reader.position
+        self._seen_until = max(self._seen_until, self._origin)
+        self._partial_tokens = []
+    
+    def _detected(self, result: dict, source: str = "final") -> bool:
+        """
+        Kiểm tra hypothesis của recognizer có chứa wake word không
+        
+        Args:
+            result: JSON của Result()/FinalResult() hoặc PartialResult()
+            source: "final" hoặc "partial"
+        """
+        if source == "partial":
+            text = result.get('partial', '')
+            words = result.get('partial_result') or []
+        else:
+            text = result.get('text', '')
+            words = result.get('result') or []
+        
+        tokens = tokenize(text)
+        # Partial chỉ thay đổi ở cuối: bỏ qua các cửa sổ đã xét ở lần trước
+        first = 0
+        if source == "partial":
+            while (first < min(len(tokens), len(self._partial_tokens)) and
+                   tokens[first] == self._partial_tokens[first]):
+                first += 1
+            self._partial_tokens = tokens
+        else:
+            self._partial_tokens = []
+            if text:
+                self.logger.debug(f"Nhận dạng: '{text}'")
+        
+        # Kiểm tra wake word
+        match = self.matcher.match(tokens, first)
+        if match is None:
+            return False
+        start, end, score = match
+        
+        # Vị trí audio ngay sau keyword (theo thời gian từng từ của Vosk)
+        position = self.reader.position
+        timed = len(words) == len(tokens) and 'end' in words[end - 1]
+        if timed:
+            position = min(position, self._origin + int(words[end - 1]['end'] * self.sample_rate))
+        latency = (self.reader.capture.ring.written - position) / self.sample_rate
+        if not timed and end < len(tokens):
+            # Đã có từ sau keyword nhưng không biết keyword kết thúc ở đâu:
+            # ghi lại từ đầu câu nói, không làm mất phần đầu câu hỏi
+            position = self._origin
+        
+        # Chỉ kết quả final mới có cả câu hỏi (partial bị cắt giữa câu); grammar
+        # chỉ cho [unk] sau keyword -> câu hỏi được ghi âm lại từ sau keyword
+        trailing = text.split()[end:]
+        if source == "partial" or UNKNOWN_WORD in trailing:
+            self.trailing_text = ""
+        else:
+            self.trailing_text = " ".join(trailing)
+        self.detection_position = position
+        self.detections[source] += 1
+        self.latencies.append(latency)
+        self.logger.info(f"✅ Phát hiện wake word: '{text}' ({source}, điểm {score:.2f}, "
+                         f"trễ {latency * 1000:.0f}ms)")
+        
+        # Không phát hiện lại cùng câu nói khi recognizer chốt kết quả
+        self.recognizer.Reset()
+        self._origin = self.reader.position
+        self._partial_tokens = []
+        return True
+    
+    @property
+    def decoded_fraction(self) -> float:
+        """Tỉ lệ audio thực sự được đưa vào recognizer"""
+        return min(1.0, self.samples_decoded / max(self.samples_seen, 1))
+    
+    def get_stats(self) -> dict:
+        """Thống kê: tỉ lệ audio được decode, số lần phát hiện, độ trễ phát hiện"""
+        latencies = sorted(self.latencies)
+        return {
+            'seconds_seen': round(self.samples_seen / self.sample_rate, 1),
+            'decoded_fraction': round(self.decoded_fraction, 3),
+            'decoding': self._decoding,
+            'detections': dict(self.detections),
+            'latency_ms': {
+                'p50': round(latencies[len(latencies) // 2] * 1000) if latencies else None,
+                'max': round(latencies[-1] * 1000) if latencies else None,
+            },
+        }
+    
     def start_listening(self, mic_index: Optional[int] = None):
         """Bắt đầu lắng nghe wake word"""
         if self.is_listening:
@@ -54,27 +361,21 @@ class WakeWordDetector:
         self.logger.info("Bắt đầu lắng nghe wake word...")
         
         try:
-            self.stream = self.audio.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=self.sample_rate,
-                input=True,
-                input_device_index=mic_index,
-                frames_per_buffer=self.chunk_size
-            )
+            self.reader = get_microphone(self.config, mic_index).open_reader("wake_word")
+            self._resync()
+            self._decoding = self.gate is None
             self.is_listening = True
             self.logger.info(f"🎤 Đang lắng nghe '{self.keyword}'...")
-            
+        
         except Exception as e:
             self.logger.error(f"Không thể mở microphone: {e}")
             raise
     
     def stop_listening(self):
         """Dừng lắng nghe"""
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-            self.stream = None
+        if self.reader:
+            self.reader.close()
+            self.reader = None
         
         self.is_listening = False
         self.logger.info("Đã dừng lắng nghe.")
@@ -83,27 +384,57 @@ class WakeWordDetector:
         """
         Kiểm tra xem có phát hiện wake word không
         
+        Xử lý hết audio đã thu kể từ lần gọi trước (theo từng chunk), nên
+        gọi thưa (vd: mỗi 100ms + thời gian YOLO) cũng không mất audio.
+        
         Returns:
             True nếu phát hiện wake word
         """
-        if not self.is_listening or not self.stream:
+        if not self.is_listening or not self.reader:
             return False
         
         try:
-            data = self.stream.read(self.chunk_size, exception_on_overflow=False)
+            if self.reader.available > self.max_lag:
+                self._resync()
+                self._decoding = self.gate is None
             
-            if self.recognizer.AcceptWaveform(data):
-                result = json.loads(self.recognizer.Result())
-                text = result.get('text', '').lower()
+            while self.reader.available >= self.chunk_size:
+                start = self.reader.position
+                data = self.reader.read(self.chunk_size, timeout=0)
+                if data is None:
+                    break
+                
+                end = self.reader.position
+                if end > self._seen_until:
+                    self.samples_seen += end - max(start, self._seen_until)
+                    self._seen_until = end
                 
-                if text:
-                    self.logger.debug(f"Nhận dạng: '{text}'")
-                    
-                    # Kiểm tra wake word
-                    if self.keyword in text:
-                        self.logger.info(f"✅ Phát hiện wake word: '{text}'")
+                voice = self.gate is None or self.gate.is_voice(data)
+                if voice:
+                    self._last_voice = end
+                
+                if not self._decoding:
+                    if not voice:
+                        continue  # Im lặng: không decode
+                    # Có giọng nói: decode lại từ lookback để không cắt mất đầu từ
+                    self._decoding = True
+                    self._resync(start - self.lookback)
+                    continue
+                
+                self.samples_decoded += len(data)
+                if self.recognizer.AcceptWaveform(data.tobytes()):
+                    if self._detected(json.loads(self.recognizer.Result())):
                         return True
-            
+                elif self.use_partial:
+                    if self._detected(json.loads(self.recognizer.PartialResult()), "partial"):
+                        return True
+                
+                if self.gate is not None and end - self._last_voice > self.hold:
+                    # Im lặng đủ lâu: chốt phần còn lại rồi ngừng decode
+                    self._decoding = False
+                    if self._detected(json.loads(self.recognizer.FinalResult())):
+                        return True
+        
         except Exception as e:
             self.logger.error(f"Lỗi khi đọc audio: {e}")
         
@@ -147,15 +478,23 @@ class WakeWordDetector:
                     callback()
                 
                 time.sleep(0.01)
-                
+        
         except KeyboardInterrupt:
             self.logger.info("Dừng wake word detection loop.")
     
+    def close(self):
+        """Dừng lắng nghe và trả Vosk model cho registry"""
+        if getattr(self, 'reader', None):
+            self.stop_listening()
+        # KaldiRecognizer giữ tham chiếu tới model: bỏ trước khi trả registry
+        self.recognizer = None
+        if getattr(self, 'model', None) is not None:
+            get_model_registry().release(self.model)
+            self.model = None
+    
     def __del__(self):
         """Cleanup"""
-        self.stop_listening()
-        if hasattr(self, 'audio'):
-            self.audio.terminate()
+        self.close()
 
 # Test standalone
 if __name__ == "__main__":
@@ -172,7 +511,7 @@ if __name__ == "__main__":
         print("   (Nhấn Ctrl+C để thoát)")
         
         detector.run_loop(callback=on_wake_word_detected)
-        
+    
     except KeyboardInterrupt:
         print("\nThoát chương trình.")
     except Exception as e:
@@ -348,6 +348,209 @@ def test_modules():
         print_success("Tất cả module OK!")
         return True
 
+def test_preprocess_allocations():
+    """Test letterbox vào buffer cấp phát sẵn không cấp phát thêm mỗi frame"""
+    print_header("TEST 9: Preprocess Allocations")
+    
+    try:
+        import tracemalloc
+        import numpy as np
+        from modules.detector_backends import LetterboxPreprocessor, preprocess
+        
+        frame = np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8)
+        crop = frame[88:392, 128:512]  # Crop ROI (view, không contiguous)
+        preprocessor = LetterboxPreprocessor()
+        
+        # Kết quả phải giống hệt preprocess() cấp phát mới
+        blob, metas = preprocessor([crop], 320)
+        expected, ratio, pad = preprocess(crop, 320)
+        if not np.allclose(blob[0], expected) or metas[0][:2] != (ratio, pad):
+            print_error("Kết quả khác preprocess()")
+            return False
+        
+        for _ in range(5):  # Warm-up: cấp phát buffer lần đầu
+            preprocessor([crop], 320)
+        
+        frames = 100
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for _ in range(frames):
+            preprocessor([crop], 320)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename')
+                        if stat.size_diff > 0)
+        per_frame = allocated / frames
+        print_info(f"Cấp phát sau warm-up: {per_frame:.0f} byte/frame "
+                   f"(blob {blob.nbytes / 1e6:.1f}MB)")
+        
+        if per_frame > 1024:
+            print_error("Preprocess vẫn cấp phát mảng mỗi frame")
+            return False
+        print_success("Preprocess không cấp phát mảng mới mỗi frame")
+        return True
+    
+    except Exception as e:
+        print_error(f"Lỗi: {e}")
+        return False
+
+def test_wake_word_matcher():
+    """Test so khớp mờ wake word: nhận các cách nói keyword, không nhận câu gần giống"""
+    print_header("TEST 10: Wake Word Matcher")
+    
+    try:
+        from utils.config_loader import get_config
+        from modules.wake_word import KeywordMatcher, tokenize
+        
+        config = get_config()
+        phrases = [config.get('wake_word.keyword', 'hi uetbot')] + list(config.get('wake_word.aliases') or [])
+        matcher = KeywordMatcher(phrases, config.get('wake_word.match_threshold', 0.9))
+        
+        positives = ["hi uetbot", "hai uet bot", "hi u e t bot", "hây uét bót", "ừ hi uetbot ơi"]
+        # Chỉ khớp qua edit distance (nhầm một nguyên âm), không khớp chính xác
+        near_variants = ["hi oét bót", "hai uet bút"]
+        negatives = ["hai tết bốt", "hi tết bốt", "hai két bốt", "hai test bot", "hi robot",
+                     "hôm nay trời đẹp"]
+        
+        failed = False
+        for text in positives + near_variants:
+            if matcher.match(tokenize(text)) is None:
+                print_error(f"Không nhận keyword: \"{text}\"")
+                failed = True
+        for text in negatives:
+            result = matcher.match(tokenize(text))
+            if result is not None:
+                print_error(f"Nhận nhầm keyword: \"{text}\" (điểm {result[2]:.2f})")
+                failed = True
+        
+        if failed:
+            return False
+        print_success(f"{len(positives) + len(near_variants)} cách nói được nhận, "
+                      f"{len(negatives)} câu gần giống bị loại (ngưỡng {matcher.threshold})")
+        return True
+    
+    except Exception as e:
+        print_error(f"Lỗi: {e}")
+        return False
+
+def test_replay_second_visitor():
+    """Test replay: người mới vào zone vẫn trigger khi người cũ (đã trigger) còn đứng đó"""
+    print_header("TEST 11: Replay Second Visitor")
+    
+    try:
+        import tempfile
+        import cv2
+        import numpy as np
+        from pathlib import Path
+        from utils.config_loader import ConfigLoader
+        from modules.detector_backends import DetectorBackend
+        from modules.person_detector import PersonDetector
+        
+        class ColorBackend(DetectorBackend):
+            """Backend giả: vùng đỏ = người A (0.9), vùng xanh lá = người B (0.8)"""
+            name = "stub"
+            
+            def predict(self, image, imgsz=None):
+                rows = []
+                for channel, score in ((2, 0.9), (1, 0.8)):
+                    ys, xs = np.nonzero(image[:, :, channel] > 128)
+                    if len(xs):
+                        rows.append([xs.min(), ys.min(), xs.max(), ys.max(), score, 0])
+                return np.array(rows, dtype=np.float32).reshape(-1, 6)
+        
+        with tempfile.TemporaryDirectory() as folder:
+            # 10 FPS: A trong zone từ frame 0, B vào zone từ frame 20 (t=2.0s) tới hết
+            for i in range(60):
+                frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                cv2.rectangle(frame, (180, 130), (280, 350), (0, 0, 255), -1)
+                if i >= 20:
+                    cv2.rectangle(frame, (360, 130), (460, 350), (0, 255, 0), -1)
+                cv2.imwrite(str(Path(folder) / f"{i:04d}.png"), frame)
+            
+            config = ConfigLoader()
+            config.config['camera']['sources'] = [{'name': "replay", 'images': folder, 'fps': 10}]
+            detection = config.config['person_detection']
+            detection['motion_gate']['enable'] = False
+            detection['warmup']['runs'] = 0
+            detection['out_of_process']['enable'] = False
+            
+            detector = PersonDetector(config)
+            detector.backend = ColorBackend()
+            detector.preprocessor = None
+            try:
+                result = detector.run_replay()
+            finally:
+                detector.stop_camera()
+        
+        tracks = sorted(trigger['track_id'] for trigger in result['triggers'])
+        print_info(f"Triggers: {[(t['timestamp'], t['track_id']) for t in result['triggers']]}")
+        if len(tracks) != 2 or len(set(tracks)) != 2:
+            print_error("Người thứ hai (confidence thấp hơn) không trigger")
+            return False
+        print_success("Mỗi người trong zone trigger đúng một lần")
+        return True
+    
+    except Exception as e:
+        print_error(f"Lỗi: {e}")
+        return False
+
+def test_vad_reframing():
+    """Test VADEndpointer: chunk lẻ cho cùng speech_start/speech_end như chunk 1024 mẫu"""
+    print_header("TEST 12: VAD Re-framing")
+    
+    try:
+        import numpy as np
+        from utils.audio_utils import VADEndpointer
+        
+        # 0.5s im lặng, 1s âm hữu thanh (hoạ âm 150Hz, điều biên), 1s im lặng, lặp lại
+        rate = 16000
+        t = np.arange(rate) / rate
+        voiced = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 12))
+        voiced *= 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+        voiced = (voiced / np.abs(voiced).max() * 8000).astype(np.int16)
+        silence = np.zeros(rate, dtype=np.int16)
+        audio = np.concatenate([silence[:rate // 2], voiced, silence, voiced, silence])
+        
+        def events(chunk_sizes, frame_ms):
+            endpointer = VADEndpointer(rate, frame_ms=frame_ms, aggressiveness=0)
+            result, position = [], 0
+            sizes = iter(chunk_sizes)
+            while position < len(audio):
+                size = next(sizes)
+                result += [(e.kind, e.position) for e in endpointer.feed(audio[position:position + size])]
+                position += size
+            return result
+        
+        rng = np.random.default_rng(0)
+        odd_sizes = {
+            "1 mẫu": [1] * len(audio),
+            "lẻ 1-2000": rng.integers(1, 2000, len(audio)),
+            "479": [479] * len(audio),
+        }
+        
+        failed = False
+        for frame_ms in (10, 20, 30):
+            reference = events([1024] * len(audio), frame_ms)
+            if not any(kind == VADEndpointer.START for kind, _ in reference):
+                print_error(f"frame {frame_ms}ms: chunk 1024 không phát hiện giọng nói")
+                failed = True
+                continue
+            for name, sizes in odd_sizes.items():
+                if events(sizes, frame_ms) != reference:
+                    print_error(f"frame {frame_ms}ms, chunk {name}: event khác chunk 1024")
+                    failed = True
+            print_info(f"frame {frame_ms}ms: {reference}")
+        
+        if failed:
+            return False
+        print_success("Chunk lẻ cho cùng speech_start/speech_end với frame 10/20/30ms")
+        return True
+    
+    except Exception as e:
+        print_error(f"Lỗi: {e}")
+        return False
+
 def main():
     """Chạy tất cả tests"""
     print(Fore.CYAN + Style.BRIGHT + """
@@ -367,6 +570,10 @@ def main():
         ("Audio Devices", test_audio),
         ("Gemini API", test_gemini_api),
         ("Bot Modules", test_modules),
+        ("Preprocess Allocations", test_preprocess_allocations),
+        ("Wake Word Matcher", test_wake_word_matcher),
+        ("Replay Second Visitor", test_replay_second_visitor),
+        ("VAD Re-framing", test_vad_reframing),
     ]
     
     results = {}
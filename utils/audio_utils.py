@@ -2,10 +2,485 @@
 Audio Utils - Các hàm tiện ích xử lý audio
 """
 import pyaudio
+import threading
+import time
 import wave
 import numpy as np
-from typing import Optional
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
 import webrtcvad
+from utils.logger import setup_logger
+
+class AudioRingBuffer:
+    """
+    Ring buffer int16 một writer, nhiều reader, không dùng lock
+    
+    Writer (callback PyAudio) chép mẫu vào buffer rồi mới tăng vị trí ghi
+    (tổng số mẫu đã ghi, tăng đơn điệu). Mỗi reader giữ cursor riêng theo
+    cùng hệ toạ độ đó; reader bị bỏ lại quá capacity mẫu coi như overrun.
+    Vùng sắp bị lần ghi kế tiếp đè lên (một chunk lớn nhất) không còn được
+    coi là đọc được, để reader không chép phải dữ liệu đang ghi dở.
+    """
+    
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Số mẫu tối đa giữ lại
+        """
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._written = 0
+        self._max_write = 0  # Chunk lớn nhất từng ghi (biên an toàn cho reader)
+    
+    @property
+    def written(self) -> int:
+        """Tổng số mẫu đã ghi từ lúc tạo buffer"""
+        return self._written
+    
+    @property
+    def oldest(self) -> int:
+        """Vị trí mẫu cũ nhất còn đọc được (chưa bị lần ghi kế tiếp đè lên)"""
+        return max(0, self._written + self._max_write - self.capacity)
+    
+    def write(self, samples: np.ndarray):
+        """Ghi mẫu (chỉ gọi từ một thread)"""
+        count = len(samples)
+        if count > self.capacity:
+            # Chỉ giữ phần cuối, vị trí ghi vẫn tăng đủ count
+            self._written += count - self.capacity
+            samples = samples[-self.capacity:]
+            count = self.capacity
+        
+        # Công bố biên an toàn trước khi đè lên vùng cũ
+        self._max_write = max(self._max_write, count)
+        start = self._written % self.capacity
+        first = min(count, self.capacity - start)
+        self._buffer[start:start + first] = samples[:first]
+        self._buffer[:count - first] = samples[first:]
+        self._written += count  # Công bố sau khi đã chép xong dữ liệu
+    
+    def read_into(self, position: int, out: np.ndarray) -> bool:
+        """
+        Chép len(out) mẫu bắt đầu từ position vào out
+        
+        Returns:
+            False nếu dữ liệu đã bị ghi đè (trước hoặc trong lúc chép)
+        """
+        count = len(out)
+        if position < self.oldest:
+            return False
+        
+        start = position % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self._buffer[start:start + first]
+        out[first:] = self._buffer[:count - first]
+        
+        # Writer có thể đã vòng qua (hoặc đang ghi dở) vùng vừa chép
+        return position >= self.oldest
+
+class AudioReader:
+    """
+    Một consumer của MicrophoneCapture với cursor riêng
+    
+    Các reader (wake word, VAD, STT...) đọc độc lập, không lấy mất dữ liệu
+    của nhau; reader chậm chỉ làm chính nó bị overrun.
+    """
+    
+    def __init__(self, capture: 'MicrophoneCapture', name: str):
+        self.capture = capture
+        self.name = name
+        self.position = capture.ring.written  # Bắt đầu từ mẫu mới nhất
+        self.closed = False
+    
+    @property
+    def available(self) -> int:
+        """Số mẫu chưa đọc"""
+        return self.capture.ring.written - self.position
+    
+    def seek_latest(self):
+        """Bỏ qua dữ liệu cũ, đọc tiếp từ mẫu mới nhất"""
+        self.position = self.capture.ring.written
+    
+    def seek(self, position: int):
+        """Đọc tiếp từ position (giới hạn trong phần ring buffer còn giữ)"""
+        ring = self.capture.ring
+        self.position = min(max(position, ring.oldest), ring.written)
+    
+    def _recover(self):
+        """Reader bị bỏ lại quá xa -> nhảy tới dữ liệu cũ nhất còn giữ"""
+        skipped = self.capture.ring.oldest - self.position
+        self.position = self.capture.ring.oldest + self.capture.chunk_size
+        self.capture.logger.warning(f"Reader '{self.name}' bị overrun, bỏ {max(skipped, 0)} mẫu")
+    
+    def read(self, count: int, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Đọc đúng count mẫu, block tới khi đủ
+        
+        Args:
+            count: Số mẫu cần đọc
+            timeout: Thời gian chờ tối đa (giây), None = vô hạn
+        
+        Returns:
+            Mảng int16 (count,) hoặc None nếu hết timeout / capture đã dừng
+        """
+        if not self.capture.wait_for(lambda: self.available >= count, timeout):
+            return None
+        
+        out = np.empty(count, dtype=np.int16)
+        while not self.capture.ring.read_into(self.position, out):
+            self._recover()
+            if not self.capture.wait_for(lambda: self.available >= count, timeout):
+                return None
+        
+        self.position += count
+        return out
+    
+    def close(self):
+        """Tách reader khỏi capture"""
+        if not self.closed:
+            self.closed = True
+            self.capture._detach(self)
+
+class MicrophoneCapture:
+    """
+    Dịch vụ thu âm dùng chung: một stream PyAudio duy nhất ở callback mode
+    
+    Callback của PortAudio ghi thẳng vào AudioRingBuffer, không phụ thuộc
+    việc các module đọc nhanh hay chậm (không còn overflow khi vòng chính
+    bận chạy YOLO). Mỗi module lấy một AudioReader qua open_reader(); stream
+    mở khi có reader đầu tiên và đóng khi reader cuối cùng đóng.
+    """
+    
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 channels: int = 1,
+                 chunk_size: int = 1024,
+                 device_index: Optional[int] = None,
+                 buffer_seconds: float = 10.0):
+        """
+        Args:
+            sample_rate: Tần số mẫu (Hz)
+            channels: Số kênh thu từ device (chỉ giữ kênh đầu tiên)
+            chunk_size: Số mẫu mỗi callback
+            device_index: Index microphone (None = default)
+            buffer_seconds: Độ dài ring buffer (giây)
+        """
+        self.logger = setup_logger("MicrophoneCapture")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.chunk_size = chunk_size
+        self.device_index = device_index
+        
+        self.ring = AudioRingBuffer(int(buffer_seconds * sample_rate))
+        self._cond = threading.Condition()  # Chỉ để đánh thức reader đang chờ
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        
+        self._audio = None
+        self._stream = None
+        
+        # Loa của bot (TTS): vị trí ring lúc phát xong, audio trước mốc này
+        # (khi mic không khử echo) chỉ có giọng của chính bot
+        self.playing = False
+        self.playback_end = 0
+    
+    @property
+    def running(self) -> bool:
+        """Stream đang thu"""
+        return self._stream is not None
+    
+    def start(self):
+        """Mở stream microphone ở callback mode"""
+        if self.running:
+            return
+        
+        if self._audio is None:
+            self._audio = pyaudio.PyAudio()
+        
+        start = time.time()
+        self._stream = self._audio.open(
+            format=pyaudio.paInt16,
+            channels=self.channels,
+            rate=self.sample_rate,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.chunk_size,
+            stream_callback=self._callback
+        )
+        self._stream.start_stream()
+        self.logger.info(f"🎤 Microphone đã mở ({self.sample_rate}Hz, chunk {self.chunk_size}, "
+                         f"{(time.time() - start) * 1000:.0f}ms)")
+    
+    def stop(self):
+        """Đóng stream (reader đang chờ sẽ nhận None)"""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+            self.logger.info("Đã đóng microphone.")
+        
+        with self._cond:
+            self._cond.notify_all()
+    
+    def terminate(self):
+        """Đóng stream và giải phóng PyAudio"""
+        self.stop()
+        if self._audio is not None:
+            self._audio.terminate()
+            self._audio = None
+    
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Callback PortAudio: chép chunk vào ring buffer"""
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.channels > 1:
+            samples = samples[::self.channels]
+        
+        self.ring.write(samples)
+        
+        with self._cond:
+            self._cond.notify_all()
+        return None, pyaudio.paContinue
+    
+    def begin_playback(self):
+        """Báo loa bắt đầu phát (gọi trước khi TTS nói)"""
+        self.playing = True
+    
+    def end_playback(self):
+        """Báo loa đã phát xong, ghi lại vị trí ring hiện tại"""
+        self.playing = False
+        self.playback_end = self.ring.written
+    
+    def wait_for(self, predicate, timeout: Optional[float] = None) -> bool:
+        """Chờ tới khi predicate() đúng; False nếu hết timeout hoặc stream đã đóng"""
+        if predicate():
+            return True
+        with self._cond:
+            return self._cond.wait_for(lambda: predicate() or not self.running, timeout) and predicate()
+    
+    def open_reader(self, name: str) -> AudioReader:
+        """Tạo reader mới (mở stream nếu chưa mở)"""
+        with self._readers_lock:
+            self.start()
+            reader = AudioReader(self, name)
+            self._readers.append(reader)
+        self.logger.debug(f"Reader '{name}' đã gắn vào microphone")
+        return reader
+    
+    def _detach(self, reader: AudioReader):
+        with self._readers_lock:
+            if reader in self._readers:
+                self._readers.remove(reader)
+            if not self._readers:
+                self.stop()
+
+# Capture dùng chung cho cả process
+_capture_instance = None
+_capture_lock = threading.Lock()
+
+def get_microphone(config=None, device_index: Optional[int] = None) -> MicrophoneCapture:
+    """
+    Lấy MicrophoneCapture dùng chung (singleton), cấu hình từ mục audio
+    
+    Args:
+        config: ConfigLoader (mặc định: get_config())
+        device_index: Đổi microphone (chỉ có tác dụng khi stream chưa mở)
+    """
+    global _capture_instance
+    with _capture_lock:
+        if _capture_instance is None:
+            from utils.config_loader import get_config
+            config = config or get_config()
+            _capture_instance = MicrophoneCapture(
+                sample_rate=config.get('audio.sample_rate', 16000),
+                channels=config.get('audio.channels', 1),
+                chunk_size=config.get('audio.chunk_size', 1024),
+                device_index=config.get('audio.microphone_index'),
+                buffer_seconds=config.get('audio.buffer_seconds', 10.0)
+            )
+        if device_index is not None and not _capture_instance.running:
+            _capture_instance.device_index = device_index
+        return _capture_instance
+
+@dataclass
+class VADEvent:
+    """Sự kiện của VADEndpointer"""
+    kind: str  # "speech_start" hoặc "speech_end"
+    position: int  # Vị trí mẫu (đầu frame voiced đầu tiên / cuối frame voiced cuối cùng)
+
+class VADEndpointer:
+    """
+    VAD streaming: chia audio thành frame 10/20/30 ms hợp lệ cho webrtcvad
+    
+    - Frame là view (reshape + memoryview) trên mảng đầu vào, chỉ phần dư
+      cuối mỗi lần feed() được chép sang lần sau
+    - Cổng năng lượng RMS tính vector hoá cho cả lô frame, frame dưới ngưỡng
+      coi như im lặng mà không cần gọi webrtcvad
+    - Làm mượt: onset_ms voiced liên tiếp mới bắt đầu câu nói, hangover_ms
+      unvoiced liên tiếp mới kết thúc
+    """
+    
+    START = "speech_start"
+    END = "speech_end"
+    
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 frame_ms: int = 30,
+                 aggressiveness: int = 2,
+                 energy_threshold: float = 300.0,
+                 onset_ms: int = 90,
+                 hangover_ms: int = 450):
+        """
+        Args:
+            sample_rate: Tần số mẫu (8000, 16000, 32000 hoặc 48000 Hz)
+            frame_ms: Độ dài frame (10, 20 hoặc 30 ms)
+            aggressiveness: Mức lọc của webrtcvad (0-3)
+            energy_threshold: RMS (int16) tối thiểu để xét là giọng nói
+            onset_ms: Thời gian voiced liên tiếp để bắt đầu câu nói
+            hangover_ms: Thời gian im lặng liên tiếp để kết thúc câu nói
+        """
+        if frame_ms not in (10, 20, 30):
+            raise ValueError(f"frame_ms phải là 10, 20 hoặc 30 (nhận {frame_ms})")
+        
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_length = sample_rate * frame_ms // 1000
+        self.energy_threshold = energy_threshold
+        self.onset_frames = max(1, -(-onset_ms // frame_ms))
+        self.hangover_frames = max(1, -(-hangover_ms // frame_ms))
+        self.vad = webrtcvad.Vad(aggressiveness)
+        
+        self._pending = np.empty(self.frame_length, dtype=np.int16)  # Phần dư chưa đủ frame
+        self.reset()
+    
+    def reset(self, position: int = 0):
+        """Bắt đầu lại (vd: câu nói mới), position = vị trí mẫu tiếp theo"""
+        self.position = position
+        self.in_speech = False
+        self._pending_count = 0
+        self._voiced_run = 0
+        self._unvoiced_run = 0
+        self._last_voiced_end = position
+        
+        self.frames = 0
+        self.gated_frames = 0  # Frame bị cổng năng lượng loại (không gọi webrtcvad)
+        self.voiced_frames = 0
+    
+    def feed(self, samples: np.ndarray) -> List[VADEvent]:
+        """
+        Đưa thêm audio int16 (liền sau lần feed trước)
+        
+        Returns:
+            Các VADEvent phát sinh trong đoạn audio này
+        """
+        events = []
+        
+        if self._pending_count:
+            take = min(self.frame_length - self._pending_count, len(samples))
+            self._pending[self._pending_count:self._pending_count + take] = samples[:take]
+            self._pending_count += take
+            samples = samples[take:]
+            if self._pending_count < self.frame_length:
+                return events
+            self._process(self._pending[None, :], events)
+            self._pending_count = 0
+        
+        count = len(samples) // self.frame_length
+        if count:
+            self._process(samples[:count * self.frame_length].reshape(count, self.frame_length), events)
+        
+        rest = len(samples) - count * self.frame_length
+        if rest:
+            self._pending[:rest] = samples[-rest:]
+            self._pending_count = rest
+        return events
+    
+    def _process(self, frames: np.ndarray, events: List[VADEvent]):
+        """Phân loại một lô frame (count, frame_length) và cập nhật trạng thái"""
+        frames = np.ascontiguousarray(frames)  # View nếu đã liền mạch
+        power = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / self.frame_length
+        loud = power >= self.energy_threshold ** 2
+        data = memoryview(frames).cast('B').toreadonly()
+        frame_bytes = self.frame_length * 2
+        
+        for i in range(len(frames)):
+            self.position += self.frame_length
+            self.frames += 1
+            
+            if loud[i]:
+                voiced = self.vad.is_speech(data[i * frame_bytes:(i + 1) * frame_bytes],
+                                            self.sample_rate)
+            else:
+                voiced = False
+                self.gated_frames += 1
+            
+            if voiced:
+                self.voiced_frames += 1
+                self._voiced_run += 1
+                self._unvoiced_run = 0
+                self._last_voiced_end = self.position
+                if not self.in_speech and self._voiced_run >= self.onset_frames:
+                    self.in_speech = True
+                    onset = self.position - self._voiced_run * self.frame_length
+                    events.append(VADEvent(self.START, onset))
+            else:
+                self._voiced_run = 0
+                self._unvoiced_run += 1
+                if self.in_speech and self._unvoiced_run >= self.hangover_frames:
+                    self.in_speech = False
+                    events.append(VADEvent(self.END, self._last_voiced_end))
+    
+    def get_stats(self) -> dict:
+        """Số frame đã xử lý, tỉ lệ bị cổng năng lượng loại, tỉ lệ voiced"""
+        frames = max(self.frames, 1)
+        return {
+            'frames': self.frames,
+            'gated_ratio': round(self.gated_frames / frames, 3),
+            'voiced_ratio': round(self.voiced_frames / frames, 3),
+        }
+
+class EnergyGate:
+    """
+    Cổng phát hiện âm thanh giống giọng nói, tính vector hoá trên cả chunk
+    
+    Chunk được chia thành các frame ngắn (view, không copy); chunk mở cổng
+    nếu có frame đủ năng lượng (RMS) với tỉ lệ zero-crossing nằm trong dải
+    của giọng nói (loại tiếng xì/nhiễu tần số cao và tiếng ù tần số thấp).
+    """
+    
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 frame_ms: int = 20,
+                 rms_threshold: float = 300.0,
+                 zcr_min: float = 0.01,
+                 zcr_max: float = 0.35):
+        """
+        Args:
+            sample_rate: Tần số mẫu (Hz)
+            frame_ms: Độ dài frame phân tích (ms)
+            rms_threshold: RMS (int16) tối thiểu
+            zcr_min: Tỉ lệ zero-crossing tối thiểu (mỗi mẫu)
+            zcr_max: Tỉ lệ zero-crossing tối đa (mỗi mẫu)
+        """
+        self.frame_length = max(1, sample_rate * frame_ms // 1000)
+        self.power_threshold = float(rms_threshold) ** 2
+        self.zcr_min = zcr_min
+        self.zcr_max = zcr_max
+    
+    def is_voice(self, samples: np.ndarray) -> bool:
+        """Chunk int16 có frame nào giống giọng nói không"""
+        count = len(samples) // self.frame_length
+        if count == 0:
+            return False
+        
+        frames = samples[:count * self.frame_length].reshape(count, self.frame_length)
+        power = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / self.frame_length
+        loud = power >= self.power_threshold
+        if not loud.any():
+            return False
+        
+        signs = np.signbit(frames[loud])
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / self.frame_length
+        return bool(np.any((zcr >= self.zcr_min) & (zcr <= self.zcr_max)))
 
 class AudioRecorder:
     """Ghi âm với Voice Activity Detection"""
@@ -14,78 +489,138 @@ class AudioRecorder:
                  sample_rate=16000,
                  channels=1,
                  chunk_size=1024,
-                 silence_duration=1.5):
+                 silence_duration=1.5,
+                 capture: Optional[MicrophoneCapture] = None,
+                 pre_roll=0.0,
+                 vad_options: Optional[dict] = None,
+                 echo_cancellation: bool = False):
         """
         Args:
             sample_rate: Tần số mẫu (Hz)
             channels: Số kênh audio (1=mono, 2=stereo)
             chunk_size: Kích thước chunk
-            silence_duration: Thời gian im lặng để kết thúc (giây)
+            silence_duration: Thời gian chờ người dùng bắt đầu nói (giây)
+            capture: MicrophoneCapture dùng chung (mặc định: get_microphone())
+            pre_roll: Giây audio trước lúc gọi record() được ghép vào đầu
+                (lấy từ ring buffer, không mất câu nói ngay sau khi kích hoạt)
+            vad_options: Tham số cho VADEndpointer (frame_ms, onset_ms, hangover_ms...)
+            echo_cancellation: Mic có khử echo; False = audio không bao giờ
+                lùi về lúc loa của bot đang phát (MicrophoneCapture.playback_end)
         """
         self.sample_rate = sample_rate
         self.channels = channels
         self.chunk_size = chunk_size
         self.silence_duration = silence_duration
+        self.pre_roll = pre_roll
+        self.echo_cancellation = echo_cancellation
         
-        self.audio = pyaudio.PyAudio()
-        self.vad = webrtcvad.Vad(2)  # Aggressiveness: 0-3
-        
-    def record(self, device_index: Optional[int] = None) -> bytes:
+        self.capture = capture
+        self.reader = None
+        self.audio = None  # PyAudio chỉ tạo khi cần phát audio
+        self.endpointer = VADEndpointer(sample_rate, **(vad_options or {}))
+        self.last_speech = None  # (start, end) của câu nói trong lần ghi gần nhất
+    
+    def _get_reader(self, device_index: Optional[int] = None) -> AudioReader:
+        """Reader của recorder trên capture dùng chung (giữ mở giữa các lần ghi)"""
+        if self.reader is None or self.reader.closed:
+            if self.capture is None:
+                self.capture = get_microphone(device_index=device_index)
+            self.reader = self.capture.open_reader("recorder")
+        return self.reader
+    
+    def stream(self, device_index: Optional[int] = None, start: Optional[int] = None
+               ) -> Iterator[np.ndarray]:
         """
-        Ghi âm cho đến khi phát hiện im lặng
+        Ghi âm theo từng chunk cho đến khi phát hiện im lặng
         
-        Returns:
-            Audio data dạng bytes
+        Mỗi chunk (int16) được yield ngay khi thu được, người dùng có thể xử lý
+        (vd: decode STT) song song với lúc người dùng đang nói.
+        
+        Args:
+            device_index: Microphone (chỉ có tác dụng khi microphone dùng
+                chung chưa mở)
+            start: Vị trí mẫu (theo MicrophoneCapture.ring) bắt đầu lấy audio,
+                vd: lúc phát hiện wake word. None = pre_roll giây trước hiện tại
+        
+        Khi mic không khử echo, audio lúc bot đang nói (TTS) chỉ là giọng của
+        chính bot: start/pre-roll bị cắt tại lúc loa phát xong. Audio pre-roll
+        chỉ được ghép vào kết quả, không qua VAD; với start cho trước (không
+        có lời chào), VAD chạy từ start.
         """
-        stream = self.audio.open(
-            format=pyaudio.paInt16,
-            channels=self.channels,
-            rate=self.sample_rate,
-            input=True,
-            input_device_index=device_index,
-            frames_per_buffer=self.chunk_size
-        )
+        reader = self._get_reader(device_index)
+        capture = reader.capture
+        live_start = capture.ring.written
+        from_pre_roll = start is None
+        if from_pre_roll:
+            start = live_start - int(self.pre_roll * self.sample_rate)
+        if not self.echo_cancellation:
+            start = max(start, live_start if capture.playing else capture.playback_end)
+        reader.seek(start)
+        endpoint_start = live_start if from_pre_roll else reader.position
         
-        frames = []
-        silence_chunks = 0
-        silence_threshold = int(self.silence_duration * self.sample_rate / self.chunk_size)
+        endpointer = self.endpointer
+        endpointer.reset(endpoint_start)
+        no_speech_limit = live_start + int(self.silence_duration * self.sample_rate)
+        speech_start = None
+        self.last_speech = None
         
         print("🎤 Đang lắng nghe...")
         
         try:
             while True:
-                data = stream.read(self.chunk_size, exception_on_overflow=False)
-                frames.append(data)
+                chunk_start = reader.position
+                samples = reader.read(self.chunk_size, timeout=2.0)
+                if samples is None:
+                    print("⚠️ Không nhận được audio từ microphone.")
+                    break
+                
+                # Voice Activity Detection (frame 10/20/30ms, onset/hangover)
+                skip = min(max(endpoint_start - chunk_start, 0), len(samples))
+                for event in endpointer.feed(samples[skip:]):
+                    if event.kind == VADEndpointer.START:
+                        speech_start = event.position
+                    elif speech_start is not None:
+                        self.last_speech = (speech_start, event.position)
                 
-                # Voice Activity Detection
-                is_speech = self.vad.is_speech(data, self.sample_rate)
+                yield samples
                 
-                if not is_speech:
-                    silence_chunks += 1
-                    if silence_chunks > silence_threshold:
-                        print("🔇 Phát hiện im lặng, kết thúc ghi âm.")
-                        break
-                else:
-                    silence_chunks = 0
-                    
+                if self.last_speech is not None:
+                    print("🔇 Phát hiện im lặng, kết thúc ghi âm.")
+                    break
+                if speech_start is None and reader.position >= no_speech_limit:
+                    print("🔇 Không nghe thấy giọng nói, kết thúc ghi âm.")
+                    break
+        
         except KeyboardInterrupt:
             print("\n⏹️ Dừng ghi âm.")
-        finally:
-            stream.stop_stream()
-            stream.close()
+    
+    def record(self, device_index: Optional[int] = None, start: Optional[int] = None) -> bytes:
+        """
+        Ghi âm cho đến khi phát hiện im lặng
         
-        return b''.join(frames)
+        Returns:
+            Audio data dạng bytes (tham số như stream())
+        """
+        return b''.join(samples.tobytes() for samples in self.stream(device_index, start))
+    
+    def close(self):
+        """Tách recorder khỏi microphone dùng chung"""
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
     
     def save_wav(self, data: bytes, filename: str):
         """Lưu audio data ra file WAV"""
         with wave.open(filename, 'wb') as wf:
             wf.setnchannels(self.channels)
-            wf.setsampwidth(self.audio.get_sample_size(pyaudio.paInt16))
+            wf.setsampwidth(pyaudio.get_sample_size(pyaudio.paInt16))
             wf.setframerate(self.sample_rate)
             wf.writeframes(data)
     
     def play(self, data: bytes, device_index: Optional[int] = None):
         """Phát audio"""
+        if self.audio is None:
+            self.audio = pyaudio.PyAudio()
         stream = self.audio.open(
             format=pyaudio.paInt16,
             channels=self.channels,
@@ -100,7 +635,9 @@ class AudioRecorder:
     
     def __del__(self):
         """Cleanup"""
-        if hasattr(self, 'audio'):
+        if hasattr(self, 'reader'):
+            self.close()
+        if getattr(self, 'audio', None) is not None:
             self.audio.terminate()
 
 def list_audio_devices():
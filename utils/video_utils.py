@@ -0,0 +1,425 @@
+"""
+Video Utils - Các hàm tiện ích xử lý camera/video
+"""
+import threading
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class FrameSource:
+    """
+    Nguồn frame cho PersonDetector
+    
+    read() trả về (ret, frame, timestamp). Camera dùng thời gian thực
+    (time.time()); nguồn replay dùng thời gian media tính từ frame đầu tiên
+    (index / fps) nên kết quả chạy lại luôn giống nhau.
+    """
+    
+    live = False  # Camera thật (frame không chờ ai) hay nguồn replay
+    
+    def __init__(self, label: str):
+        self.label = label  # Mô tả nguồn (dùng trong log)
+    
+    def open(self) -> bool:
+        raise NotImplementedError
+    
+    def read(self) -> Tuple[bool, Optional[np.ndarray], float]:
+        raise NotImplementedError
+    
+    def release(self):
+        pass
+    
+    @property
+    def exhausted(self) -> bool:
+        """Nguồn replay đã hết frame"""
+        return False
+    
+    def describe(self) -> str:
+        """Thông tin nguồn sau khi mở (resolution, fps...)"""
+        return ""
+
+class CameraSource(FrameSource):
+    """Camera qua cv2.VideoCapture(device_id)"""
+    
+    live = True
+    
+    def __init__(self, device_id, resolution: Tuple[int, int] = (640, 480), fps: int = 30):
+        super().__init__(f"camera {device_id}")
+        self.device_id = device_id
+        self.resolution = resolution
+        self.fps = fps
+        self.cap = None
+    
+    def open(self) -> bool:
+        self.cap = cv2.VideoCapture(self.device_id)
+        if not self.cap.isOpened():
+            self.cap = None
+            return False
+        
+        # Set resolution (sau khi mở thành công)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        self.cap.set(cv2.CAP_PROP_FPS, self.fps)
+        # Giữ buffer driver nhỏ nhất có thể để frame luôn mới
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return True
+    
+    def read(self) -> Tuple[bool, Optional[np.ndarray], float]:
+        ret, frame = self.cap.read()
+        return ret, frame, time.time()
+    
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+    
+    def describe(self) -> str:
+        # Kiểm tra thực tế resolution đã set
+        actual_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        actual_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        actual_fps = self.cap.get(cv2.CAP_PROP_FPS)
+        return f"Resolution: {actual_width}x{actual_height} @ {actual_fps:.1f}fps"
+
+class ReplaySource(FrameSource):
+    """
+    Nguồn replay (file video, thư mục ảnh)
+    
+    realtime=False: đọc nhanh nhất có thể (benchmark/regression test).
+    realtime=True: giữ nhịp theo timestamp media như camera thật.
+    """
+    
+    def __init__(self, label: str, fps: float, realtime: bool = False):
+        super().__init__(label)
+        self.fps = fps
+        self.realtime = realtime
+        self.index = 0  # Số frame đã đọc
+        self._start_time = None
+        self._exhausted = False
+    
+    def _next_frame(self) -> Optional[np.ndarray]:
+        raise NotImplementedError
+    
+    def read(self) -> Tuple[bool, Optional[np.ndarray], float]:
+        if self._exhausted:
+            return False, None, self.index / self.fps
+        
+        frame = self._next_frame()
+        if frame is None:
+            self._exhausted = True
+            return False, None, self.index / self.fps
+        
+        timestamp = self.index / self.fps
+        self.index += 1
+        
+        if self.realtime:
+            now = time.time()
+            if self._start_time is None:
+                self._start_time = now - timestamp
+            delay = self._start_time + timestamp - now
+            if delay > 0:
+                time.sleep(delay)
+        
+        return True, frame, timestamp
+    
+    @property
+    def exhausted(self) -> bool:
+        return self._exhausted
+    
+    def describe(self) -> str:
+        mode = "real-time" if self.realtime else "nhanh nhất có thể"
+        return f"{self.fps:.1f}fps, {mode}"
+
+class VideoFileSource(ReplaySource):
+    """Replay file video"""
+    
+    def __init__(self, path: str, realtime: bool = False):
+        super().__init__(f"video {path}", fps=30.0, realtime=realtime)
+        self.path = path
+        self.cap = None
+    
+    def open(self) -> bool:
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            self.cap = None
+            return False
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or self.fps
+        return True
+    
+    def _next_frame(self) -> Optional[np.ndarray]:
+        ret, frame = self.cap.read()
+        return frame if ret else None
+    
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+class ImageFolderSource(ReplaySource):
+    """Replay thư mục ảnh (sắp theo tên file), mỗi ảnh cách nhau 1/fps giây"""
+    
+    def __init__(self, path: str, fps: float = 10.0, realtime: bool = False):
+        super().__init__(f"thư mục ảnh {path}", fps=fps, realtime=realtime)
+        self.path = Path(path)
+        self.files = []
+    
+    def open(self) -> bool:
+        if not self.path.is_dir():
+            return False
+        self.files = sorted(p for p in self.path.iterdir()
+                            if p.suffix.lower() in IMAGE_EXTENSIONS)
+        return bool(self.files)
+    
+    def _next_frame(self) -> Optional[np.ndarray]:
+        while self.index < len(self.files):
+            frame = cv2.imread(str(self.files[self.index]))
+            if frame is not None:
+                return frame
+            # Ảnh lỗi -> bỏ qua (vẫn giữ timestamp của các ảnh sau)
+            self.index += 1
+        return None
+
+def create_frame_source(source_config: dict, resolution: Tuple[int, int] = (640, 480),
+                        fps: int = 30) -> FrameSource:
+    """
+    Tạo FrameSource từ một mục trong camera.sources
+    
+    Args:
+        source_config: {video: path} | {images: dir, fps} | {device_id}
+            kèm realtime (bool) cho nguồn replay
+        resolution: Resolution yêu cầu cho camera
+        fps: FPS yêu cầu cho camera
+    """
+    realtime = source_config.get('realtime', False)
+    if source_config.get('video'):
+        return VideoFileSource(source_config['video'], realtime=realtime)
+    if source_config.get('images'):
+        return ImageFolderSource(source_config['images'],
+                                 fps=source_config.get('fps', 10.0), realtime=realtime)
+    return CameraSource(source_config.get('device_id', 0), resolution, fps)
+
+class LatestFrameCapture:
+    """
+    Đọc camera liên tục trong thread riêng, chỉ giữ lại frame mới nhất
+    
+    Buffer của OpenCV/V4L2 bị đầy nếu không đọc thường xuyên, khiến frame
+    lấy ra bị trễ hàng trăm ms. Thread này rút frame liên tục vào một "slot"
+    duy nhất (kèm số thứ tự và timestamp), người dùng luôn lấy frame mới nhất
+    mà không bị block.
+    """
+    
+    def __init__(self, source: FrameSource, name: str = "camera"):
+        """
+        Args:
+            source: FrameSource (camera) đã mở
+            name: Tên thread (dùng cho debug)
+        """
+        self.source = source
+        self.name = name
+        
+        # Slot frame mới nhất
+        self._lock = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._timestamp = 0.0
+        self._last_read_seq = 0
+        
+        # Thống kê
+        self.frames_captured = 0
+        self.frames_dropped = 0  # Frame bị ghi đè trước khi được đọc
+        self.read_failures = 0
+        self._fps = 0.0
+        self._fps_window_start = 0.0
+        self._fps_window_count = 0
+        
+        self._thread = None
+        self._running = False
+    
+    def start(self):
+        """Khởi động thread đọc camera"""
+        if self._running:
+            return
+        
+        self._running = True
+        self._fps_window_start = time.time()
+        self._thread = threading.Thread(
+            target=self._capture_loop,
+            name=f"capture-{self.name}",
+            daemon=True
+        )
+        self._thread.start()
+    
+    def stop(self):
+        """Dừng thread đọc camera (không release source)"""
+        self._running = False
+        with self._lock:
+            self._lock.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+    
+    def _capture_loop(self):
+        """Vòng lặp rút frame từ camera"""
+        while self._running:
+            ret, frame, timestamp = self.source.read()
+            
+            if not ret:
+                self.read_failures += 1
+                time.sleep(0.01)
+                continue
+            
+            with self._lock:
+                # Frame trước chưa ai đọc -> bị bỏ qua
+                if self._frame is not None and self._seq != self._last_read_seq:
+                    self.frames_dropped += 1
+                
+                self._frame = frame
+                self._seq += 1
+                self._timestamp = timestamp
+                self.frames_captured += 1
+                self._lock.notify_all()
+            
+            # Cập nhật FPS mỗi giây
+            self._fps_window_count += 1
+            elapsed = timestamp - self._fps_window_start
+            if elapsed >= 1.0:
+                self._fps = self._fps_window_count / elapsed
+                self._fps_window_start = timestamp
+                self._fps_window_count = 0
+    
+    def read(self, wait: bool = False, timeout: Optional[float] = None
+             ) -> Tuple[Optional[np.ndarray], int, float]:
+        """
+        Lấy frame mới nhất
+        
+        Args:
+            wait: Đợi frame mới (seq khác lần đọc trước) nếu chưa có
+            timeout: Thời gian chờ tối đa khi wait=True (giây)
+        
+        Returns:
+            (frame, seq, timestamp) - frame là None nếu chưa có frame nào.
+            Frame được chia sẻ, không được vẽ trực tiếp lên nó.
+        """
+        with self._lock:
+            if wait and self._running:
+                self._lock.wait_for(
+                    lambda: self._seq != self._last_read_seq or not self._running,
+                    timeout=timeout
+                )
+            
+            self._last_read_seq = self._seq
+            return self._frame, self._seq, self._timestamp
+    
+    def get_stats(self) -> dict:
+        """Thống kê capture: FPS, số frame đã đọc/bị bỏ/lỗi"""
+        return {
+            'fps': round(self._fps, 1),
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.frames_dropped,
+            'read_failures': self.read_failures,
+            'latest_seq': self._seq,
+        }
+
+class MotionGate:
+    """
+    Bộ lọc chuyển động rẻ tiền đứng trước YOLO
+    
+    So sánh frame (đã thu nhỏ, grayscale, chỉ trong ROI) với background
+    running-average. YOLO chỉ cần chạy khi tỉ lệ pixel thay đổi vượt ngưỡng,
+    hoặc khi đã quá force_interval giây kể từ lần chạy trước.
+    """
+    
+    def __init__(self,
+                 roi: Optional[Tuple[int, int, int, int]] = None,
+                 width: int = 80,
+                 threshold: float = 0.01,
+                 pixel_threshold: int = 25,
+                 alpha: float = 0.05,
+                 force_interval: float = 5.0):
+        """
+        Args:
+            roi: Vùng quan tâm (x1, y1, x2, y2), None = toàn frame
+            width: Chiều rộng ảnh sau khi thu nhỏ (pixel)
+            threshold: Tỉ lệ pixel thay đổi tối thiểu để chạy detector (0-1)
+            pixel_threshold: Chênh lệch grayscale để coi 1 pixel là thay đổi
+            alpha: Tốc độ cập nhật background (0-1)
+            force_interval: Buộc chạy detector sau mỗi khoảng này (giây)
+        """
+        self.roi = roi
+        self.width = width
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.alpha = alpha
+        self.force_interval = force_interval
+        
+        self._background = None
+        self._last_run_time = None
+        self.motion_energy = 0.0
+        
+        # Thống kê
+        self.frames_seen = 0
+        self.frames_passed = 0
+    
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Cắt ROI, thu nhỏ và chuyển grayscale (float32)"""
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            frame = frame[y1:y2, x1:x2]
+        
+        height = max(1, round(frame.shape[0] * self.width / max(1, frame.shape[1])))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.float32)
+    
+    def update(self, frame: np.ndarray, timestamp: float, force: bool = False) -> bool:
+        """
+        Cập nhật background với frame mới và quyết định có chạy detector không
+        
+        Args:
+            frame: Frame BGR đầy đủ
+            timestamp: Thời điểm capture frame
+            force: Luôn chạy detector (vẫn cập nhật background)
+        
+        Returns:
+            True nếu cần chạy detector cho frame này
+        """
+        gray = self._prepare(frame)
+        self.frames_seen += 1
+        
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            self.motion_energy = 1.0
+        else:
+            diff = cv2.absdiff(gray, self._background)
+            self.motion_energy = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+            cv2.accumulateWeighted(gray, self._background, self.alpha)
+        
+        forced = (force or self._last_run_time is None or
+                  timestamp - self._last_run_time >= self.force_interval)
+        
+        if self.motion_energy >= self.threshold or forced:
+            self._last_run_time = timestamp
+            self.frames_passed += 1
+            return True
+        
+        return False
+    
+    @property
+    def skip_ratio(self) -> float:
+        """Tỉ lệ frame không cần chạy detector"""
+        if self.frames_seen == 0:
+            return 0.0
+        return 1.0 - self.frames_passed / self.frames_seen
+    
+    def get_stats(self) -> dict:
+        """Thống kê: số frame, số lần chạy detector, tỉ lệ bỏ qua"""
+        return {
+            'frames_seen': self.frames_seen,
+            'frames_passed': self.frames_passed,
+            'skip_ratio': round(self.skip_ratio, 3),
+            'motion_energy': round(self.motion_energy, 4),
+        }